@@ -0,0 +1,109 @@
+"""
+Compare the HTML parser backends.
+
+Usage: python benchmarks/parsers.py [--number N] [FILE ...]
+
+Times parsing alone as well as quote_html() and unwrap_html() for each
+available backend, using the given HTML files (by default, the test files and
+a large generated newsletter). "lxml-fresh" creates a new lxml parser for every
+call, which is how quotequail parsed before parsers were reused.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import timeit
+
+import lxml.html
+
+# Run against the quotequail of this checkout rather than an installed one.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import quotequail
+from quotequail import _html
+
+
+def parse_html_lxml_fresh(html_str):
+    parser = lxml.html.HTMLParser(encoding="utf-8")
+    return lxml.html.fromstring(html_str.encode("utf8"), parser=parser)
+
+
+def get_parsers():
+    parsers = {
+        "lxml": "lxml",
+        "lxml-fresh": parse_html_lxml_fresh,
+    }
+    try:
+        import html5lib  # noqa: F401
+    except ImportError:
+        print("html5lib is not installed, skipping it.")
+    else:
+        parsers["html5lib"] = "html5lib"
+    return parsers
+
+
+def get_documents(paths):
+    if not paths:
+        tests_dir = os.path.join(os.path.dirname(__file__), "..", "tests")
+        paths = sorted(glob.glob(os.path.join(tests_dir, "files", "*.html")))
+
+    documents = {}
+    for path in paths:
+        with open(path, encoding="utf8") as f:
+            documents[os.path.basename(path)] = f.read()
+
+    if len(documents) > 1:
+        documents = {"all files": "\n".join(documents.values()), **documents}
+
+    documents["newsletter (generated)"] = (
+        "<html><body><table>"
+        + "".join(
+            f'<tr><td class="item"><a href="https://example.com/{i}">'
+            f"<b>Item {i}</b></a><br>Some description.</td></tr>"
+            for i in range(5000)
+        )
+        + "</table></body></html>"
+    )
+    return documents
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    arg_parser.add_argument("--number", type=int, default=10)
+    arg_parser.add_argument("files", nargs="*")
+    args = arg_parser.parse_args()
+
+    parsers = get_parsers()
+    documents = get_documents(args.files)
+    functions = {
+        "parse": lambda html, parser: _html.get_html_tree(html, parser),
+        "quote_html": lambda html, parser: quotequail.quote_html(
+            html, parser=parser
+        ),
+        "unwrap_html": lambda html, parser: quotequail.unwrap_html(
+            html, parser=parser
+        ),
+    }
+
+    print(f"{'document':<30} {'function':<12}", end="")
+    for name in parsers:
+        print(f" {name:>12}", end="")
+    print()
+
+    for doc_name, html in documents.items():
+        for func_name, func in functions.items():
+            print(f"{doc_name[:30]:<30} {func_name:<12}", end="")
+            for parser in parsers.values():
+                seconds = timeit.timeit(
+                    lambda func=func, html=html, parser=parser: func(
+                        html, parser
+                    ),
+                    number=args.number,
+                )
+                print(f" {seconds / args.number * 1000:>10.3f}ms", end="")
+            print()
+
+
+if __name__ == "__main__":
+    main()
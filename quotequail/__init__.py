@@ -1,15 +1,84 @@
 # quotequail
 # a library that identifies quoted text in email messages
 
-from . import _internal, _patterns
+from collections.abc import Iterable
+from typing import TYPE_CHECKING, Any
+
+from . import _batch, _files, _internal, _patterns
+from ._cache import (
+    CacheBackend,
+    MemoryBackend,
+    ResultCache,
+    SQLiteBackend,
+)
 from ._enums import Position
+from ._results import QuoteStreamResult, UnwrapResult
+from ._scanner import QuoteScanner
+
+if TYPE_CHECKING:
+    import os
+    from concurrent.futures import Executor
+
+    from ._html import HTMLParserBackend
 
 __version__ = "0.5.0"
-__all__ = ["quote", "quote_html", "unwrap", "unwrap_html"]
+__all__ = [
+    "CacheBackend",
+    "MemoryBackend",
+    "QuoteScanner",
+    "QuoteStreamResult",
+    "ResultCache",
+    "SQLiteBackend",
+    "UnwrapResult",
+    "might_contain_quote",
+    "might_contain_quote_html",
+    "quote",
+    "quote_file",
+    "quote_html",
+    "quote_html_many",
+    "quote_many",
+    "quote_spans",
+    "quote_stream",
+    "unwrap",
+    "unwrap_file",
+    "unwrap_html",
+    "unwrap_html_many",
+    "unwrap_lazy",
+    "unwrap_many",
+    "unwrap_spans",
+    "unwrap_thread",
+    "unwrap_thread_html",
+]
+
+
+def might_contain_quote(text: str) -> bool:
+    """
+    Cheaply check whether the given plain text message may contain quoted
+    text, i.e. a reply/forward line, lines starting with ">" or forwarded
+    headers, without splitting it into lines.
+
+    Returns False only if quote() won't find quoted text (unless the line
+    limit is reached) and unwrap() returns None. A return value of True
+    doesn't guarantee that anything is found.
+    """
+    return _internal.might_contain_quote(text)
+
+
+def might_contain_quote_html(html: str) -> bool:
+    """
+    Like might_contain_quote(), but takes an HTML message as an argument. The
+    check is done on the raw markup, without parsing it.
+    """
+    return _internal.might_contain_quote_html(html)
 
 
 def quote(
-    text: str, *, limit: int = 1000, quote_intro_line: bool = False
+    text: str | bytes,
+    *,
+    limit: int | None = 1000,
+    quote_intro_line: bool = False,
+    charset: str | None = None,
+    parent: str | bytes | None = None,
 ) -> list[tuple[bool, str]]:
     """
     Divide email body into quoted parts.
@@ -21,6 +90,12 @@ def quote(
         quote_intro_line: Whether the line introducing the quoted text ("On ...
             wrote:" / "Begin forwarded message:") should be part of the quoted
             text.
+        charset: The charset of the message if it's passed as bytes (UTF-8 by
+            default). Undecodable bytes are replaced.
+        parent: The text of the message that is replied to, if known. If it's
+            quoted in the message, the quoting is found by matching its lines
+            rather than by looking for reply/forward patterns on every line.
+            Otherwise, the patterns are used.
 
     Returns:
         List of tuples: The first argument of the tuple denotes whether the
@@ -29,28 +104,152 @@ def quote(
 
         Example: [(True, 'expanded text'), (False, '> Some quoted text')]
     """
+    text, _ = _internal.decode_text(text, charset)
+    if parent is not None:
+        parent, _ = _internal.decode_text(parent, charset)
+    return [
+        (expand, text[start:end])
+        for expand, start, end in quote_spans(
+            text, limit=limit, quote_intro_line=quote_intro_line, parent=parent
+        )
+    ]
+
+
+def quote_spans(
+    text: str,
+    *,
+    limit: int | None = 1000,
+    quote_intro_line: bool = False,
+    parent: str | None = None,
+) -> list[tuple[bool, int, int]]:
+    """
+    Like quote(), but returns the character offsets of the parts instead of
+    copying them.
+
+    Returns:
+        List of tuples (expand, start, end), where text[start:end] is the
+        corresponding part that quote() returns.
+
+        Example: [(True, 0, 13), (False, 14, 32)]
+    """
+    if (
+        parent is None
+        and (limit is None or text.count("\n") + 1 < limit)
+        and not _internal.might_contain_quote(text)
+    ):
+        return [(True, 0, len(text))]
+
     lines = text.split("\n")
 
     position = Position.Begin if quote_intro_line else Position.End
-    found = _internal.find_quote_position(
-        lines,
-        _patterns.MAX_WRAP_LINES,
-        limit=limit,
-        position=position,
-    )
+    found = None
+    if parent is not None:
+        found = _internal.find_parent_position(
+            lines,
+            parent.split("\n"),
+            _patterns.MAX_WRAP_LINES,
+            limit=limit,
+            position=position,
+        )
+    if found is None:
+        found = _internal.find_quote_position(
+            lines,
+            _patterns.MAX_WRAP_LINES,
+            limit=limit,
+            position=position,
+        )
 
     if found is None:
-        return [(True, text)]
+        return [(True, 0, len(text))]
 
     split_idx = found if quote_intro_line else found + 1
+    split_offset = _internal.line_offset(lines, split_idx)
     return [
-        (True, "\n".join(lines[:split_idx])),
-        (False, "\n".join(lines[split_idx:])),
+        (True, 0, max(split_offset - 1, 0)),
+        (False, min(split_offset, len(text)), len(text)),
     ]
 
 
+def quote_file(
+    path: "str | os.PathLike[str]",
+    *,
+    limit: int | None = 1000,
+    quote_intro_line: bool = False,
+    charset: str | None = None,
+) -> list[tuple[bool, int, int]]:
+    """
+    Like quote_spans(), but takes the path of a file containing a plain text
+    message and returns byte offsets into the file. The file is
+    memory-mapped, and only the lines that are looked at are decoded, so only
+    the beginning of a large file is read unless it has quoting further down.
+
+    The charset (UTF-8 by default) must encode newlines like ASCII, otherwise
+    ValueError is raised.
+    """
+    with _files.mapped_lines(path, charset) as lines:
+        stream = _internal.LineStream(lines)
+        position = Position.Begin if quote_intro_line else Position.End
+        found = _internal.find_quote_position_stream(
+            stream, _patterns.MAX_WRAP_LINES, limit=limit, position=position
+        )
+
+        size = len(lines.data)
+        if found is None:
+            return [(True, 0, size)]
+
+        split_idx = found if quote_intro_line else found + 1
+        split_offset = lines.offset(split_idx)
+        return [
+            (True, 0, max(split_offset - 1, 0)),
+            (False, min(split_offset, size), size),
+        ]
+
+
+def quote_stream(
+    lines: Iterable[str],
+    *,
+    limit: int | None = 1000,
+    quote_intro_line: bool = False,
+) -> QuoteStreamResult:
+    """
+    Like quote(), but reads the message lazily from an iterable of lines, e.g.
+    a text file object. Lines may end with a newline. Only the lines up to the
+    quoting (or the limit) and the few following lines that a wrapped reply
+    pattern could span are read.
+
+    Returns a QuoteStreamResult with the text that should be expanded by
+    default, whether a quoted part follows, and an iterator over the remaining
+    lines, which haven't been read or split.
+    """
+    stream = _internal.LineStream(lines)
+
+    position = Position.Begin if quote_intro_line else Position.End
+    found = _internal.find_quote_position_stream(
+        stream,
+        _patterns.MAX_WRAP_LINES,
+        limit=limit,
+        position=position,
+    )
+
+    split_idx = len(stream.lines)
+    if found is not None:
+        split_idx = found if quote_intro_line else found + 1
+    return QuoteStreamResult(
+        "\n".join(stream.lines[:split_idx]),
+        found is not None,
+        stream.offset(split_idx),
+        stream.rest(split_idx),
+    )
+
+
 def quote_html(
-    html: str, *, limit: int = 1000, quote_intro_line: bool = False
+    html: str | bytes,
+    *,
+    limit: int = 1000,
+    quote_intro_line: bool = False,
+    incremental: bool = False,
+    parser: "HTMLParserBackend" = "lxml",
+    charset: str | None = None,
 ) -> list[tuple[bool, str]]:
     """
     Like quote(), but takes an HTML message as an argument.
@@ -62,14 +261,58 @@ def quote_html(
         quote_intro_line: Whether the line introducing the quoted text ("On ...
             wrote:" / "Begin forwarded message:") should be part of the quoted
             text.
+        incremental: Whether to parse a full HTML document (starting with
+            <html> or a doctype) incrementally, and stop parsing once the
+            quoted text or the line limit is found. The markup that wasn't
+            parsed is appended unmodified to the quoted part. Only supported
+            by the lxml parser backend.
+        parser: The parser backend: "lxml" (default), "html5lib" (requires
+            the html5lib package), or a callable that takes the markup and
+            returns an lxml tree like lxml.html.fromstring().
+        charset: The charset of the message if it's passed as bytes (UTF-8 by
+            default). The lxml parser backend parses the bytes directly.
+
+    If the markup can't contain any quoting and is below the limit, it's
+    returned unmodified without being parsed. Otherwise, the returned parts
+    are re-serialized from the parsed tree.
     """
+    html_bytes = html if isinstance(html, bytes) else None
+    html, encoding = _internal.decode_text(html, charset)
+
+    if _internal.max_html_lines(
+        html, limit
+    ) < limit and not _internal.might_contain_quote_html(html):
+        return [(True, html)]
+
     from . import _html
 
-    tree = _html.get_html_tree(html)
+    position = Position.Begin if quote_intro_line else Position.End
+
+    remainder = ""
+    open_elements = None
+    if (
+        incremental
+        and parser == "lxml"
+        and _patterns.HTML_DOCUMENT_RE.match(html)
+    ):
+
+        def is_complete(tree: _html.Element) -> bool:
+            lines = _html.get_line_info(tree, limit + 1)[2]
+            found = _internal.find_quote_position(
+                lines, 1, limit=limit, position=position
+            )
+            # The last line may continue in the markup that follows.
+            return found is not None and found + 1 < len(lines)
+
+        tree, consumed, open_elements = _html.get_html_tree_prefix(
+            html, is_complete
+        )
+        remainder = html[consumed:]
+    else:
+        tree = _html.get_html_tree(html, parser, html_bytes, encoding)
 
     start_refs, end_refs, lines = _html.get_line_info(tree, limit + 1)
 
-    position = Position.Begin if quote_intro_line else Position.End
     found = _internal.find_quote_position(
         lines, 1, limit=limit, position=position
     )
@@ -79,18 +322,22 @@ def quote_html(
         return [(True, _html.render_html_tree(tree))]
 
     split_idx = found if quote_intro_line else found + 1
-    start_tree = _html.slice_tree(
-        tree, start_refs, end_refs, (0, split_idx), html_copy=html
+    start_tree, end_tree = _html.slice_trees(
+        tree, start_refs, end_refs, [(0, split_idx), (split_idx, None)]
     )
-    end_tree = _html.slice_tree(tree, start_refs, end_refs, (split_idx, None))
 
     return [
         (True, _html.render_html_tree(start_tree)),
-        (False, _html.render_html_tree(end_tree)),
+        (False, _html.render_html_tree(end_tree, open_elements) + remainder),
     ]
 
 
-def unwrap(text: str) -> dict[str, str] | None:
+def unwrap(
+    text: str | bytes,
+    *,
+    charset: str | None = None,
+    parent: str | bytes | None = None,
+) -> dict[str, str] | None:
     """
     If the passed text is the text body of a forwarded message, a reply, or
     contains quoted text, a dictionary with the following keys is returned:
@@ -103,51 +350,174 @@ def unwrap(text: str) -> dict[str, str] | None:
     - text: Unindented text of the wrapped message (if found)
 
     Otherwise, this function returns None.
+
+    The text may be passed as bytes in the given charset (UTF-8 by default).
+
+    If the text of the message that is replied to is passed as parent and
+    it's quoted in the message, the quoted section is found by matching its
+    lines, like in quote().
+    """
+    text, _ = _internal.decode_text(text, charset)
+    if parent is not None:
+        parent, _ = _internal.decode_text(parent, charset)
+    result = unwrap_lazy(text, parent=parent)
+    return result.to_dict() if result else None
+
+
+def _unwrap_lines(
+    text: str, parent: str | None
+) -> (
+    tuple[
+        list[str],
+        tuple[
+            str,
+            tuple[int | None, int | None],
+            dict[str, str] | None,
+            tuple[int | None, int | None] | None,
+            tuple[int | None, int | None] | None,
+            bool,
+        ],
+    ]
+    | None
+):
     """
+    Split the text into lines and return them along with the result of
+    _internal.unwrap(), or None if nothing was found.
+    """
+    if not _internal.might_contain_quote(text):
+        return None
+
     lines = text.split("\n")
 
+    unwrap_start = None
+    if parent is not None:
+        unwrap_start = _internal.find_parent_start(
+            lines,
+            parent.split("\n"),
+            _patterns.MAX_WRAP_LINES,
+            _patterns.MIN_QUOTED_LINES,
+        )
+
     unwrap_result = _internal.unwrap(
         lines,
         _patterns.MAX_WRAP_LINES,
         _patterns.MIN_HEADER_LINES,
         _patterns.MIN_QUOTED_LINES,
+        unwrap_start,
     )
     if not unwrap_result:
         return None
+    return lines, unwrap_result
 
-    typ, top_range, hdrs, main_range, bottom_range, needs_unindent = (
-        unwrap_result
-    )
 
-    text_top_lines = lines[slice(*top_range)] if top_range else []
-    text_lines = lines[slice(*main_range)] if main_range else []
-    text_bottom_lines = lines[slice(*bottom_range)] if bottom_range else []
+def unwrap_lazy(
+    text: str, *, parent: str | None = None
+) -> UnwrapResult | None:
+    """
+    Like unwrap(), but returns an UnwrapResult object instead of a dictionary.
+    The result's type and headers are available right away, while its text,
+    text_top and text_bottom attributes are only built when first accessed.
+    to_dict() returns what unwrap() returns. The parent message may be
+    passed like to unwrap().
 
-    if needs_unindent:
-        text_lines = _internal.unindent_lines(text_lines)
+    Returns None if unwrap() would return None.
+    """
+    result = _unwrap_lines(text, parent)
+    if not result:
+        return None
+    return UnwrapResult(*result)
 
-    result = {
-        "type": typ,
-    }
 
-    text = "\n".join(text_lines).strip()
-    text_top = "\n".join(text_top_lines).strip()
-    text_bottom = "\n".join(text_bottom_lines).strip()
+def unwrap_spans(
+    text: str, *, parent: str | None = None
+) -> dict[str, str | bool | tuple[int, int]] | None:
+    """
+    Like unwrap(), but the "text_top", "text" and "text_bottom" keys contain
+    (start, end) character offsets into the passed text instead of copies of
+    the text, e.g. text[start:end] is the text at the top of the message.
 
-    if text:
-        result["text"] = text
-    if text_top:
-        result["text_top"] = text_top
-    if text_bottom:
-        result["text_bottom"] = text_bottom
+    If the wrapped message is quoted, the "unindent" key is True. In that case,
+    one level of quoting ("> " or ">") needs to be removed from each line in
+    text[start:end] and the result stripped to get the text of the wrapped
+    message. The parent message may be passed like to unwrap().
 
-    if hdrs:
-        result.update(hdrs)
+    Returns None if unwrap() would return None.
+    """
+    result = _unwrap_lines(text, parent)
+    if not result:
+        return None
+    return _internal.unwrap_spans(*result)
 
-    return result
+
+def unwrap_file(
+    path: "str | os.PathLike[str]", *, charset: str | None = None
+) -> dict[str, str | bool | tuple[int, int]] | None:
+    """
+    Like unwrap_spans(), but takes the path of a file containing a plain text
+    message and returns byte offsets into the file. The file is
+    memory-mapped and its lines are decoded one at a time when they're looked
+    at, so the message is never loaded as a whole.
+
+    The charset (UTF-8 by default) must encode newlines like ASCII, otherwise
+    ValueError is raised.
+    """
+    with _files.mapped_lines(path, charset) as lines:
+        unwrap_result = _internal.unwrap(
+            lines,
+            _patterns.MAX_WRAP_LINES,
+            _patterns.MIN_HEADER_LINES,
+            _patterns.MIN_QUOTED_LINES,
+        )
+        if not unwrap_result:
+            return None
+
+        encoding = lines.encoding
+        return _internal.unwrap_spans(
+            lines,
+            unwrap_result,
+            lines.offset,
+            lambda text: len(text.encode(encoding)),
+        )
+
+
+def unwrap_thread(
+    text: str | bytes, *, charset: str | None = None
+) -> list[dict[str, str]]:
+    """
+    Unwrap all messages nested in the passed text, e.g. a chain of forwards,
+    and return a list with a dictionary for each level, outermost first. The
+    first dictionary is what unwrap() returns for the text, the second one is
+    what unwrap() returns for the text of the first wrapped message, and so
+    on, but the message is only split into lines once.
+
+    Since the text of a wrapped message contains all messages nested in it,
+    the "text" key is only included for the innermost message. The text of
+    each message is found in the "text_top" key of the following level.
+
+    Returns an empty list if unwrap() would return None.
+    """
+    text, _ = _internal.decode_text(text, charset)
+    if not _internal.might_contain_quote(text):
+        return []
+
+    levels = _internal.unwrap_thread(
+        text.split("\n"),
+        _patterns.MAX_WRAP_LINES,
+        _patterns.MIN_HEADER_LINES,
+        _patterns.MIN_QUOTED_LINES,
+    )
+    return [
+        UnwrapResult(lines, unwrap_result).to_dict(text=n == len(levels) - 1)
+        for n, (lines, unwrap_result) in enumerate(levels)
+    ]
 
 
-def unwrap_html(html: str) -> dict[str, str] | None:
+def unwrap_html(
+    html: str | bytes,
+    *,
+    parser: "HTMLParserBackend" = "lxml",
+    charset: str | None = None,
+) -> dict[str, str] | None:
     """
     If the passed HTML is the HTML body of a forwarded message, a dictionary
     with the following keys is returned:
@@ -160,10 +530,19 @@ def unwrap_html(html: str) -> dict[str, str] | None:
     - html: HTML of the forwarded message (if found)
 
     Otherwise, this function returns None.
+
+    The parser backend and the charset of markup passed as bytes can be
+    chosen like in quote_html().
     """
+    html_bytes = html if isinstance(html, bytes) else None
+    html, encoding = _internal.decode_text(html, charset)
+
+    if not _internal.might_contain_quote_html(html):
+        return None
+
     from . import _html
 
-    tree = _html.get_html_tree(html)
+    tree = _html.get_html_tree(html, parser, html_bytes, encoding)
 
     start_refs, end_refs, lines = _html.get_line_info(tree)
 
@@ -184,33 +563,223 @@ def unwrap_html(html: str) -> dict[str, str] | None:
     main_range_slice = _html.trim_slice(lines, main_range)
     bottom_range_slice = _html.trim_slice(lines, bottom_range)
 
-    if top_range_slice:
-        top_tree = _html.slice_tree(
-            tree, start_refs, end_refs, top_range_slice, html_copy=html
+    # Slice the main part last since it's taken from the parsed tree itself.
+    slices = {
+        key: slice_tuple
+        for key, slice_tuple in (
+            ("html_top", top_range_slice),
+            ("html_bottom", bottom_range_slice),
+            ("html", main_range_slice),
         )
-        html_top = _html.render_html_tree(top_tree)
-        if html_top:
-            result["html_top"] = html_top
-
-    if bottom_range_slice:
-        bottom_tree = _html.slice_tree(
-            tree, start_refs, end_refs, bottom_range_slice, html_copy=html
-        )
-        html_bottom = _html.render_html_tree(bottom_tree)
-        if html_bottom:
-            result["html_bottom"] = html_bottom
-
-    if main_range_slice:
-        main_tree = _html.slice_tree(
-            tree, start_refs, end_refs, main_range_slice
-        )
-        if needs_unindent:
-            _html.unindent_tree(main_tree)
-        html = _html.render_html_tree(main_tree)
-        if html:
-            result["html"] = html
+        if slice_tuple
+    }
+    trees = _html.slice_trees(
+        tree, start_refs, end_refs, list(slices.values())
+    )
+    for key, slice_tree in zip(slices, trees):
+        if key == "html" and needs_unindent:
+            _html.unindent_tree(slice_tree)
+        rendered = _html.render_html_tree(slice_tree)
+        if rendered:
+            result[key] = rendered
 
     if hdrs:
         result.update(hdrs)
 
     return result
+
+
+def unwrap_thread_html(
+    html: str | bytes,
+    *,
+    parser: "HTMLParserBackend" = "lxml",
+    charset: str | None = None,
+) -> list[dict[str, str]]:
+    """
+    Like unwrap_thread(), but takes an HTML message, and returns what
+    unwrap_html() returns for each level. The markup is only parsed once,
+    and the HTML of each level is sliced from the parsed tree, so the "html"
+    key is only included for the innermost message.
+
+    Since the levels aren't re-parsed from their rendered HTML, they can
+    differ from what repeated unwrap_html() calls return on degenerate
+    markup, e.g. quoted elements without any text (such as empty
+    blockquotes), or a wrapped message without any text.
+
+    The parser backend and the charset of markup passed as bytes can be
+    chosen like in quote_html().
+    """
+    html_bytes = html if isinstance(html, bytes) else None
+    html, encoding = _internal.decode_text(html, charset)
+
+    if not _internal.might_contain_quote_html(html):
+        return []
+
+    from . import _html
+
+    tree = _html.get_html_tree(html, parser, html_bytes, encoding)
+
+    start_refs, end_refs, lines = _html.get_line_info(tree)
+
+    # The lines of each level are a view of the lines of the whole tree, so
+    # the ranges of a level are offset by the start of its view, and the HTML
+    # sliced for it has to be unindented as often as the view is.
+    results: list[dict[str, str]] = []
+    slices: list[tuple[dict[str, str], str, tuple[int, int], int]] = []
+    main = None
+    view = _internal.LineView(lines)
+    while True:
+        unwrap_result = _internal.unwrap(
+            view, 1, _patterns.MIN_HEADER_LINES, 1
+        )
+        if not unwrap_result:
+            break
+        typ, top_range, hdrs, main_range, bottom_range, needs_unindent = (
+            unwrap_result
+        )
+        result = {"type": typ}
+        results.append(result)
+        for key, range_ in (
+            ("html_top", top_range),
+            ("html_bottom", bottom_range),
+        ):
+            slice_tuple = _html.trim_slice(view, range_)
+            # Like slice_tree(), treat slices outside of the view as empty.
+            if slice_tuple and slice_tuple[0] < len(view) and slice_tuple[1]:
+                start, stop = slice_tuple
+                slices.append(
+                    (
+                        result,
+                        key,
+                        (view.start + start, view.start + stop),
+                        view.level,
+                    )
+                )
+        if hdrs:
+            result.update(hdrs)
+
+        main = None
+        main_slice = _html.trim_slice(view, main_range)
+        if not main_slice:
+            break
+        inner = _internal.LineView(view, *main_slice, int(needs_unindent))
+        if not inner:
+            break
+        main = (result, "html", (inner.start, inner.stop), inner.level)
+        # Stop if nothing would change anymore.
+        if len(inner) == len(view) and not needs_unindent:
+            break
+        view = inner
+
+    # Slice the main part of the innermost message last since it's taken from
+    # the parsed tree itself.
+    if main:
+        slices.append(main)
+    trees = _html.slice_trees(
+        tree, start_refs, end_refs, [slice_[2] for slice_ in slices]
+    )
+    for (result, key, _, level), slice_tree in zip(slices, trees):
+        for _ in range(level):
+            _html.unindent_tree(slice_tree)
+        rendered = _html.render_html_tree(slice_tree)
+        if rendered:
+            result[key] = rendered
+
+    return results
+
+
+def quote_many(
+    texts: Iterable[str | bytes],
+    *,
+    executor: "Executor | None" = None,
+    chunk_size: int | None = None,
+    **kwargs: Any,
+) -> list[list[tuple[bool, str]] | Exception]:
+    """
+    Run quote() on each of the given plain text messages, passing it the
+    given keyword arguments, and return the results in the same order. If
+    quote() raises an exception for a message, the exception is returned in
+    place of its result.
+
+    Args:
+        texts: Plain text messages.
+        executor: The concurrent.futures executor to run the messages on in
+            chunks. It isn't shut down afterwards. By default, a process pool
+            with one worker per CPU is created for the batch, unless there is
+            a single CPU or the batch fits in a single chunk, in which case
+            the messages are processed in the calling thread.
+        chunk_size: The number of messages passed to a worker at once. By
+            default, the messages are spread over four chunks per CPU, with
+            at most 256 messages per chunk.
+        kwargs: Keyword arguments passed to quote().
+    """
+    return _batch.run_many(
+        quote,
+        texts,
+        kwargs,
+        executor,
+        chunk_size,
+        _batch.process_executor,
+    )
+
+
+def quote_html_many(
+    htmls: Iterable[str | bytes],
+    *,
+    executor: "Executor | None" = None,
+    chunk_size: int | None = None,
+    **kwargs: Any,
+) -> list[list[tuple[bool, str]] | Exception]:
+    """
+    Like quote_many(), but runs quote_html() on HTML messages. The default
+    executor is a thread pool, since lxml releases the GIL while parsing, and
+    each worker thread creates its lxml parser when it starts.
+    """
+    return _batch.run_many(
+        quote_html,
+        htmls,
+        kwargs,
+        executor,
+        chunk_size,
+        _batch.thread_executor,
+    )
+
+
+def unwrap_many(
+    texts: Iterable[str | bytes],
+    *,
+    executor: "Executor | None" = None,
+    chunk_size: int | None = None,
+    **kwargs: Any,
+) -> list[dict[str, str] | None | Exception]:
+    """
+    Like quote_many(), but runs unwrap() on each message.
+    """
+    return _batch.run_many(
+        unwrap,
+        texts,
+        kwargs,
+        executor,
+        chunk_size,
+        _batch.process_executor,
+    )
+
+
+def unwrap_html_many(
+    htmls: Iterable[str | bytes],
+    *,
+    executor: "Executor | None" = None,
+    chunk_size: int | None = None,
+    **kwargs: Any,
+) -> list[dict[str, str] | None | Exception]:
+    """
+    Like quote_html_many(), but runs unwrap_html() on each message.
+    """
+    return _batch.run_many(
+        unwrap_html,
+        htmls,
+        kwargs,
+        executor,
+        chunk_size,
+        _batch.thread_executor,
+    )
@@ -0,0 +1,119 @@
+import math
+import os
+from collections.abc import Callable, Iterable
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Chunks per worker when the chunk size isn't given, so that workers that
+# get long messages don't hold up the others at the end of the batch.
+CHUNKS_PER_WORKER = 4
+
+# Upper bound for the default chunk size, so that results come back and
+# memory is freed steadily on large batches.
+MAX_CHUNK_SIZE = 256
+
+
+def _warm_up_thread() -> None:
+    """
+    Thread pool initializer: Create the thread's lxml parser up front.
+    """
+    from ._html import get_lxml_parser
+
+    get_lxml_parser("utf-8")
+
+
+def process_executor() -> Executor:
+    return ProcessPoolExecutor()
+
+
+def thread_executor() -> Executor:
+    return ThreadPoolExecutor(initializer=_warm_up_thread)
+
+
+def default_chunk_size(count: int) -> int:
+    """
+    Return the chunk size for a batch of the given number of items, spreading
+    them over CHUNKS_PER_WORKER chunks per CPU.
+    """
+    workers = os.cpu_count() or 1
+    return max(
+        1,
+        min(MAX_CHUNK_SIZE, math.ceil(count / (workers * CHUNKS_PER_WORKER))),
+    )
+
+
+def run_chunk(
+    func: Callable[..., R], items: list[T], kwargs: dict[str, Any]
+) -> list[R | Exception]:
+    """
+    Call func on each item with the given keyword arguments, returning the
+    exception raised for an item in place of its result.
+    """
+    results: list[R | Exception] = []
+    for item in items:
+        try:
+            results.append(func(item, **kwargs))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def run_many(
+    func: Callable[..., R],
+    items: Iterable[T],
+    kwargs: dict[str, Any],
+    executor: Executor | None,
+    chunk_size: int | None,
+    make_executor: Callable[[], Executor],
+) -> list[R | Exception]:
+    """
+    Call func on each item in chunks of chunk_size items on the executor, and
+    return the results in the order of the items. If no executor is passed,
+    one is created with make_executor() and shut down afterwards, unless the
+    batch fits in a single chunk or there's a single CPU, in which case the
+    items are processed in the calling thread.
+    """
+    items = list(items)
+    if chunk_size is None:
+        chunk_size = default_chunk_size(len(items))
+    elif chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    chunks = [
+        items[start : start + chunk_size]
+        for start in range(0, len(items), chunk_size)
+    ]
+    if executor is None:
+        if len(chunks) <= 1 or (os.cpu_count() or 1) == 1:
+            return run_chunk(func, items, kwargs)
+        with make_executor() as own_executor:
+            return _run_chunks(func, chunks, kwargs, own_executor)
+    return _run_chunks(func, chunks, kwargs, executor)
+
+
+def _run_chunks(
+    func: Callable[..., R],
+    chunks: list[list[T]],
+    kwargs: dict[str, Any],
+    executor: Executor,
+) -> list[R | Exception]:
+    futures: list[Future[list[R | Exception]]] = [
+        executor.submit(run_chunk, func, chunk, kwargs) for chunk in chunks
+    ]
+    results: list[R | Exception] = []
+    for chunk, future in zip(chunks, futures):
+        try:
+            results.extend(future.result())
+        except Exception as e:
+            # The chunk couldn't be run at all, e.g. because an item couldn't
+            # be pickled or a worker process died.
+            results.extend(e for _ in chunk)
+    return results
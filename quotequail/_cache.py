@@ -0,0 +1,375 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Protocol
+
+import quotequail
+
+from . import _internal, _patterns
+
+# Types of keyword argument values that are part of cache keys. Calls with
+# other values, e.g. a custom parser callable, aren't cached.
+KEY_TYPES = (str, bytes, int, bool, type(None))
+
+# Serialized entries from this size on are compressed.
+COMPRESS_MIN_SIZE = 256
+
+
+class CacheBackend(Protocol):
+    """
+    Storage of a ResultCache. Keys are hex digests, and entries are made of
+    lists, dicts, strings, integers and booleans, so that they can be
+    serialized as JSON.
+    """
+
+    def get(self, key: str) -> Any | None:
+        """
+        Return the entry stored for the key, or None.
+        """
+
+    def set(self, key: str, entry: Any, size: int) -> None:
+        """
+        Store the entry for the key. The size is the approximate number of
+        bytes the entry takes up.
+        """
+
+
+class MemoryBackend:
+    """
+    In-memory storage that evicts the least recently used entries once it
+    holds more than max_entries entries or max_bytes bytes. It can be shared
+    between threads.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Number of bytes held by the entries
+        self.size = 0
+        self._entries: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key: str, entry: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = entry, size
+            self.size += size
+            while (
+                len(self._entries) > self.max_entries
+                or self.size > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+
+@functools.cache
+def cache_version() -> str:
+    """
+    Return a digest of the library version and the pattern set, which is part
+    of every cache key so that results are recomputed after an upgrade.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for value in (
+        quotequail.__version__,
+        _patterns.PATTERNS,
+        [style.pattern for style in _patterns.FORWARD_STYLES],
+        _patterns.HEADER_MAP,
+        _patterns.MAX_WRAP_LINES,
+        _patterns.MIN_HEADER_LINES,
+        _patterns.MIN_QUOTED_LINES,
+    ):
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+def entry_size(entry: Any) -> int:
+    """
+    Return the approximate number of bytes an entry takes up.
+    """
+    if isinstance(entry, str):
+        return 50 + len(entry)
+    if isinstance(entry, (list, tuple)):
+        return 50 + sum(entry_size(item) for item in entry)
+    if isinstance(entry, dict):
+        return 50 + sum(
+            entry_size(key) + entry_size(value) for key, value in entry.items()
+        )
+    return 30
+
+
+def unwrap_from_spans(text: str, spans: dict[str, Any]) -> dict[str, str]:
+    """
+    Rebuild what unwrap() returns for the text from what unwrap_spans()
+    returned for it.
+    """
+    result = {}
+    for key, value in spans.items():
+        if key == "unindent":
+            continue
+        if key not in ("text", "text_top", "text_bottom"):
+            result[key] = value
+            continue
+        start, end = value
+        part = text[start:end]
+        if key == "text" and spans.get("unindent"):
+            part = "\n".join(
+                _internal.unindent_line(line) for line in part.split("\n")
+            ).strip()
+        result[key] = part
+    return result
+
+
+def decode_args(
+    text: str | bytes, kwargs: dict[str, Any]
+) -> tuple[str, dict[str, Any]]:
+    """
+    Decode the plain text message and the parent message (if given) of a
+    quote() or unwrap() call with its charset argument, and return the text
+    along with the remaining keyword arguments for quote_spans() or
+    unwrap_spans().
+    """
+    kwargs = dict(kwargs)
+    charset = kwargs.pop("charset", None)
+    text, _ = _internal.decode_text(text, charset)
+    if kwargs.get("parent") is not None:
+        kwargs["parent"], _ = _internal.decode_text(kwargs["parent"], charset)
+    return text, kwargs
+
+
+def encode_entry(entry: Any) -> bytes:
+    """
+    Serialize an entry as compact JSON, compressed with zlib if it's long.
+    """
+    data = json.dumps(entry, separators=(",", ":")).encode()
+    if len(data) >= COMPRESS_MIN_SIZE:
+        return b"z" + zlib.compress(data)
+    return b"j" + data
+
+
+def decode_entry(data: bytes) -> Any:
+    """
+    Deserialize an entry serialized by encode_entry().
+    """
+    if data[:1] == b"z":
+        return json.loads(zlib.decompress(data[1:]))
+    return json.loads(data[1:])
+
+
+class SQLiteBackend:
+    """
+    Persistent storage in a SQLite database file, which can be shared by
+    several threads and processes, e.g. the workers of a prefork server or
+    successive runs over the same messages. Each thread of each process
+    uses its own connection. Entries are stored as compact JSON, so plain
+    text results take up a few dozen bytes.
+
+    The database uses write-ahead logging so that readers don't block the
+    writer. Entries aren't evicted; delete the file to clear the cache.
+    """
+
+    def __init__(
+        self, path: "str | os.PathLike[str]", *, timeout: float = 30.0
+    ) -> None:
+        self.path = os.fspath(path)
+        self.timeout = timeout
+        self._local = threading.local()
+        # Create the database right away so that errors surface early.
+        self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Return the connection of this thread, opening a new one after a fork.
+        """
+        local = self._local
+        pid = os.getpid()
+        if getattr(local, "pid", None) != pid:
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key BLOB PRIMARY KEY, entry BLOB NOT NULL) WITHOUT ROWID"
+            )
+            local.connection = connection
+            local.pid = pid
+        return local.connection
+
+    def get(self, key: str) -> Any | None:
+        cursor = self._connection().execute(
+            "SELECT entry FROM results WHERE key = ?", (bytes.fromhex(key),)
+        )
+        row = cursor.fetchone()
+        return decode_entry(row[0]) if row else None
+
+    def set(self, key: str, entry: Any, size: int) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?)",
+            (bytes.fromhex(key), encode_entry(entry)),
+        )
+
+    def close(self) -> None:
+        """
+        Close the connection of this thread.
+        """
+        if getattr(self._local, "pid", None) == os.getpid():
+            self._local.connection.close()
+        self._local.pid = None
+
+
+class ResultCache:
+    """
+    Cache of quote(), unwrap(), quote_html() and unwrap_html() results, keyed
+    by a digest of the message, the arguments, the library version and the
+    pattern set. Repeated messages, e.g. duplicate deliveries, aren't
+    processed again, and HTML messages aren't parsed again.
+
+    For plain text messages, only the offsets of the parts are stored, and
+    the parts are sliced from the passed message on a cache hit.
+
+    Attributes:
+        memory: In-memory LRU store bounded by max_entries and max_bytes,
+            which is looked up first.
+        backend: Optional second-level storage, e.g. a SQLiteBackend shared
+            between processes. Entries found there are added to memory.
+        hits: Number of calls that were answered from the cache.
+        misses: Number of calls whose results were computed and stored.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend | None = None,
+        *,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+    ) -> None:
+        self.memory = MemoryBackend(max_entries, max_bytes)
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    def _key(
+        self, name: str, message: str | bytes, kwargs: dict[str, Any]
+    ) -> str | None:
+        """
+        Return the cache key of the call, or None if it can't be cached.
+        """
+        if not all(isinstance(value, KEY_TYPES) for value in kwargs.values()):
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(
+            f"{cache_version()}\0{name}\0{sorted(kwargs.items())!r}\0".encode()
+        )
+        if isinstance(message, str):
+            digest.update(b"s")
+            message = message.encode("utf-8", "surrogatepass")
+        else:
+            digest.update(b"b")
+        digest.update(message)
+        return digest.hexdigest()
+
+    def _get(self, key: str | None) -> Any | None:
+        if key is None:
+            return None
+        entry = self.memory.get(key)
+        if entry is None and self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None:
+                self.memory.set(key, entry, entry_size(entry))
+        if entry is not None:
+            with self._counter_lock:
+                self.hits += 1
+        return entry
+
+    def _set(self, key: str | None, entry: Any) -> None:
+        if key is None:
+            return
+        with self._counter_lock:
+            self.misses += 1
+        size = entry_size(entry)
+        self.memory.set(key, entry, size)
+        if self.backend is not None:
+            self.backend.set(key, entry, size)
+
+    def quote(
+        self, text: str | bytes, **kwargs: Any
+    ) -> list[tuple[bool, str]]:
+        """
+        Like quotequail.quote(), taking the same keyword arguments.
+        """
+        key = self._key("quote", text, kwargs)
+        text, kwargs = decode_args(text, kwargs)
+        spans = self._get(key)
+        if spans is None:
+            spans = [
+                list(span) for span in quotequail.quote_spans(text, **kwargs)
+            ]
+            self._set(key, spans)
+        return [(expand, text[start:end]) for expand, start, end in spans]
+
+    def unwrap(
+        self, text: str | bytes, **kwargs: Any
+    ) -> dict[str, str] | None:
+        """
+        Like quotequail.unwrap(), taking the same keyword arguments.
+        """
+        key = self._key("unwrap", text, kwargs)
+        text, kwargs = decode_args(text, kwargs)
+        # An empty dict stands for None, since unwrap() results have a type.
+        spans = self._get(key)
+        if spans is None:
+            spans = quotequail.unwrap_spans(text, **kwargs) or {}
+            self._set(key, spans)
+        return unwrap_from_spans(text, spans) if spans else None
+
+    def quote_html(
+        self, html: str | bytes, **kwargs: Any
+    ) -> list[tuple[bool, str]]:
+        """
+        Like quotequail.quote_html(), taking the same keyword arguments. On a
+        cache hit, the markup isn't parsed.
+        """
+        key = self._key("quote_html", html, kwargs)
+        parts = self._get(key)
+        if parts is None:
+            parts = [
+                list(part) for part in quotequail.quote_html(html, **kwargs)
+            ]
+            self._set(key, parts)
+        return [(part[0], part[1]) for part in parts]
+
+    def unwrap_html(
+        self, html: str | bytes, **kwargs: Any
+    ) -> dict[str, str] | None:
+        """
+        Like quotequail.unwrap_html(), taking the same keyword arguments. On
+        a cache hit, the markup isn't parsed.
+        """
+        key = self._key("unwrap_html", html, kwargs)
+        result = self._get(key)
+        if result is None:
+            result = quotequail.unwrap_html(html, **kwargs) or {}
+            self._set(key, result)
+        return dict(result) if result else None
@@ -0,0 +1,102 @@
+import mmap
+import os
+from array import array
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from typing import overload
+
+from . import _internal
+
+
+class MappedLines(Sequence[str]):
+    """
+    The lines of a memory-mapped file (or of bytes), like
+    data.split(b"\\n"), decoded one at a time when they're accessed. Line
+    boundaries are found with find() as far as lines are requested, and only
+    their offsets are kept.
+    """
+
+    def __init__(self, data: "mmap.mmap | bytes", encoding: str) -> None:
+        self.data = data
+        self.encoding = encoding
+        # Byte offset of each line found so far
+        self._starts = array("q", [0])
+        self._complete = False
+
+    def _find(self, count: int) -> int:
+        """
+        Find the boundaries of at least count lines (unless there are fewer)
+        and return the number of lines found.
+        """
+        starts = self._starts
+        while len(starts) < count and not self._complete:
+            pos = self.data.find(b"\n", starts[-1])
+            if pos == -1:
+                self._complete = True
+            else:
+                starts.append(pos + 1)
+        return len(starts)
+
+    def offset(self, n: int) -> int:
+        """
+        Return the byte offset of line n. For the line after the last one,
+        this is the size of the data plus one, like for text that ended with
+        a newline.
+        """
+        if self._find(n + 1) > n:
+            return self._starts[n]
+        return len(self.data) + 1
+
+    def _decode(self, n: int) -> str:
+        start = self._starts[n]
+        end = (
+            self._starts[n + 1] - 1
+            if n + 1 < len(self._starts)
+            else len(self.data)
+        )
+        return self.data[start:end].decode(self.encoding, errors="replace")
+
+    def __len__(self) -> int:
+        return self._find(len(self.data) + 2)
+
+    @overload
+    def __getitem__(self, key: int) -> str: ...
+
+    @overload
+    def __getitem__(self, key: slice) -> _internal.LineView: ...
+
+    def __getitem__(self, key: int | slice) -> "str | _internal.LineView":
+        if isinstance(key, slice):
+            return _internal.LineView(self)[key]
+        if key < 0:
+            key += len(self)
+        if key < 0 or self._find(key + 2) <= key:
+            raise IndexError("line index out of range")
+        return self._decode(key)
+
+    def __iter__(self) -> Iterator[str]:
+        n = 0
+        while self._find(n + 2) > n:
+            yield self._decode(n)
+            n += 1
+
+
+@contextmanager
+def mapped_lines(
+    path: "str | os.PathLike[str]", charset: str | None = None
+) -> Iterator[MappedLines]:
+    """
+    Memory-map the given file for reading and yield its MappedLines in the
+    given charset (UTF-8 by default), which must encode newlines like ASCII.
+    Empty files, which can't be mapped, are read as empty bytes.
+    """
+    _, encoding = _internal.decode_text("", charset)
+    if "\n".encode(encoding) != b"\n":
+        raise ValueError(f"unsupported charset: {encoding}")
+
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            yield MappedLines(b"", encoding)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield MappedLines(data, encoding)
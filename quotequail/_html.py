@@ -1,6 +1,9 @@
 # HTML utils
+import copy
 import html
-from collections.abc import Iterator
+import threading
+import types
+from collections.abc import Callable, Iterator, Sequence
 from typing import TYPE_CHECKING, TypeAlias
 
 import lxml.etree
@@ -10,11 +13,28 @@ if TYPE_CHECKING:
     from lxml.html import HtmlElement
 
 from ._enums import Position
-from ._patterns import FORWARD_LINE, FORWARD_STYLES, MULTIPLE_WHITESPACE_RE
+from ._patterns import (
+    FORWARD_LINE,
+    FORWARD_STYLES,
+    HTML_CHUNK_BOUNDARY_RE,
+    HTML_DOCUMENT_RE,
+    HTML_PREFIXED_TAG_RE,
+    MULTIPLE_WHITESPACE_RE,
+)
 
 Element: TypeAlias = "HtmlElement"
 ElementRef = tuple["Element", Position]
 
+# Amount of markup fed to the parser at first by get_html_tree_prefix(). It
+# is doubled with every chunk.
+INITIAL_CHUNK_SIZE = 16384
+
+# Comment that marks the end of the markup fed to the parser.
+PREFIX_END_MARKER = "quotequail-prefix-end"
+
+# Holds the reusable parsers of each thread.
+_thread_local = threading.local()
+
 INLINE_TAGS = [
     "a",
     "b",
@@ -76,7 +96,7 @@ def trim_tree_before(
 
 
 def trim_slice(
-    lines: list[str], slice_tuple: tuple[int | None, int | None] | None
+    lines: Sequence[str], slice_tuple: tuple[int | None, int | None] | None
 ) -> tuple[int, int] | None:
     """
     Trim a slice tuple (begin, end) so it starts at the first non-empty line
@@ -122,24 +142,67 @@ def unindent_tree(element: Element) -> None:
             return
 
 
+def clone_tree(
+    tree: Element, refs: list[ElementRef | None]
+) -> tuple[Element, list[ElementRef | None]]:
+    """
+    Return a copy of the given tree, along with the given element references
+    mapped to the corresponding elements of the copy.
+
+    The whole document is copied so that the copy of the tree keeps its
+    ancestors (the tree may be an element within the parsed document, see
+    get_html_tree()). The tree and the referenced elements are temporarily
+    marked with an attribute so that they can be located in the copy without
+    walking the document in Python.
+    """
+    marks = [(tree, "__clone_tree")] + [
+        (ref[0], f"__clone_ref_{n}") for n, ref in enumerate(refs) if ref
+    ]
+    for el, mark in marks:
+        el.attrib[mark] = ""
+
+    new_root = copy.deepcopy(tree.getroottree().getroot())
+
+    for el, mark in marks:
+        del el.attrib[mark]
+
+    new_tree = None
+    new_refs: list[ElementRef | None] = [None] * len(refs)
+    for el in new_root.xpath(
+        "descendant-or-self::*[@*[starts-with(name(), '__clone_')]]"
+    ):
+        for name in list(el.attrib):
+            if name == "__clone_tree":
+                new_tree = el
+            elif name.startswith("__clone_ref_"):
+                n = int(name[12:])
+                new_refs[n] = (el, refs[n][1])  # type: ignore[index]
+            else:
+                continue
+            del el.attrib[name]
+
+    return new_tree, new_refs
+
+
 def slice_tree(
     tree: Element,
     start_refs: list[ElementRef | None],
     end_refs: list[ElementRef | None],
     slice_tuple: tuple[int | None, int | None] | None,
-    html_copy: str | None = None,
+    clone: bool = False,
 ):
     """
     Slice the HTML tree with the given start_refs and end_refs (obtained via
     get_line_info) at the given slice_tuple, a tuple (start, end) containing
     the start and end of the slice (or None, to start from the start / end at
-    the end of the tree). If html_copy is specified, a new tree is constructed
-    from the given HTML (which must be the equal to the original tree's HTML*).
-    The resulting tree is returned.
-
-    *) The reason we have to specify the HTML is that we can't reliably
-       construct a copy of the tree using copy.copy() (see bug
-       https://bugs.launchpad.net/lxml/+bug/1562550).
+    the end of the tree). If clone is True, the slice is taken from a copy of
+    the tree (see clone_tree()), otherwise the given tree is modified. The
+    resulting tree is returned.
+
+    We used to construct copies by re-parsing the HTML since copy.copy()
+    doesn't reliably copy a tree (see bug
+    https://bugs.launchpad.net/lxml/+bug/1562550). A deep copy of the parsed
+    tree is equivalent and avoids parsing the document again.
     """
     start_ref = None
     end_ref = None
@@ -166,19 +229,8 @@ def slice_tree(
     if slice_end is not None and slice_end < len(end_refs):
         end_ref = end_refs[slice_end - 1]
 
-    if html_copy is not None:
-        et = lxml.etree.ElementTree(tree)
-
-        new_tree = get_html_tree(html_copy)
-
-        if start_ref:
-            selector = et.getelementpath(start_ref[0])
-            start_ref = (new_tree.find(selector), start_ref[1])
-
-        if end_ref:
-            selector = et.getelementpath(end_ref[0])
-            end_ref = (new_tree.find(selector), end_ref[1])
-
+    if clone:
+        new_tree, (start_ref, end_ref) = clone_tree(tree, [start_ref, end_ref])
     else:
         new_tree = tree
 
@@ -205,18 +257,171 @@ def slice_tree(
     return new_tree
 
 
-def get_html_tree(html_str: str) -> Element:
+def slice_trees(
+    tree: Element,
+    start_refs: list[ElementRef | None],
+    end_refs: list[ElementRef | None],
+    slice_tuples: list[tuple[int | None, int | None]],
+) -> list[Element]:
+    """
+    Slice the HTML tree at each of the given slice tuples (see slice_tree())
+    and return the resulting trees, all from a single parsed tree. All slices
+    but the last one are taken from clones of the tree, the last one is taken
+    from the tree itself, which is modified.
+    """
+    last = len(slice_tuples) - 1
+    return [
+        slice_tree(tree, start_refs, end_refs, slice_tuple, clone=n < last)
+        for n, slice_tuple in enumerate(slice_tuples)
+    ]
+
+
+def parse_html_lxml(html_str: str) -> Element:
+    """
+    Parse the given markup with lxml's (libxml2-based) HTML parser, like
+    lxml.html.fromstring(). The parser is created once per thread and reused.
+    This is the default parser backend.
+    """
+    parser = get_lxml_parser("utf-8")
+    assert parser is not None
+    return lxml.html.fromstring(html_str.encode("utf8"), parser=parser)
+
+
+def get_lxml_parser(encoding: str) -> lxml.html.HTMLParser | None:
+    """
+    Return this thread's lxml HTML parser for markup in the given encoding,
+    or None if libxml2 doesn't support the encoding.
+    """
+    parsers = getattr(_thread_local, "lxml_parsers", None)
+    if parsers is None:
+        parsers = _thread_local.lxml_parsers = {}
+    try:
+        return parsers[encoding]
+    except KeyError:
+        pass
+    try:
+        parser = lxml.html.HTMLParser(encoding=encoding)
+    except LookupError:
+        parser = None
+    parsers[encoding] = parser
+    return parser
+
+
+def parse_html_html5lib(html_str: str) -> Element:
+    """
+    Parse the given markup with html5lib, which follows the HTML5 parsing
+    algorithm like browsers do, but is much slower than lxml. Requires the
+    html5lib package. Like lxml.html.fromstring(), returns the <html> element
+    of a full document, and the body's only element (or the body as a <div>)
+    of a fragment.
+    """
+    import html5lib
+
+    parser = getattr(_thread_local, "html5lib_parser", None)
+    if parser is None:
+        parser = html5lib.HTMLParser(
+            tree=html5lib.getTreeBuilder("etree", _HTML5LIB_ETREE),
+            namespaceHTMLElements=False,
+        )
+        _thread_local.html5lib_parser = parser
+
+    # Copy the <html> element into a document of its own, without html5lib's
+    # document root element.
+    root = copy.deepcopy(parser.parse(html_str))
+
+    # Unlike lxml, html5lib puts SVG and MathML elements in a namespace.
+    for el in root.xpath("descendant-or-self::*[namespace-uri() != '']"):
+        el.tag = lxml.etree.QName(el).localname
+
+    if HTML_DOCUMENT_RE.match(html_str) or len(root.find("head")):
+        return root
+
+    body = root.find("body")
+    if (
+        len(body) == 1
+        and not (body.text or "").strip()
+        and not (body[0].tail or "").strip()
+    ):
+        return body[0]
+    body.tag = "div"
+    return body
+
+
+def _make_html5lib_element(tag: str, *args, **kwargs) -> Element:
+    """
+    Create an lxml.html element for html5lib's tree builder. Tags that lxml
+    doesn't accept (including html5lib's doctype node) become <span>.
+    """
+    try:
+        return lxml.html.Element(tag, *args, **kwargs)
+    except ValueError:
+        return lxml.html.Element("span", *args, **kwargs)
+
+
+# ElementTree-like implementation for html5lib's etree tree builder, which
+# unlike its lxml tree builder keeps tag names like <o:p> intact.
+_HTML5LIB_ETREE = types.SimpleNamespace(
+    __name__="quotequail._html",
+    Comment=lxml.html.HtmlComment,
+    Element=_make_html5lib_element,
+    ElementTree=lxml.etree.ElementTree,
+)
+
+
+# Parser backends by name. A parser backend takes markup and returns an lxml
+# tree like lxml.html.fromstring() does.
+HTML_PARSERS: dict[str, Callable[[str], Element]] = {
+    "lxml": parse_html_lxml,
+    "html5lib": parse_html_html5lib,
+}
+
+HTMLParserBackend: TypeAlias = "str | Callable[[str], Element]"
+
+
+def get_html_tree(
+    html_str: str,
+    parser: HTMLParserBackend = "lxml",
+    html_bytes: bytes | None = None,
+    encoding: str = "utf-8",
+) -> Element:
     """
     Given the HTML string, returns a LXML tree object. The tree is wrapped in
     <div> elements if it doesn't have a top level tag or parsing would
     otherwise result in an error. The wrapping can be later removed with
     strip_wrapping().
+
+    The parser backend is either a name from HTML_PARSERS or a callable.
+
+    If the markup is also passed as bytes in an ASCII compatible encoding,
+    the lxml backend parses them directly instead of encoding html_str
+    again.
     """
-    parser = lxml.html.HTMLParser(encoding="utf-8")
-    htmlb = html_str.encode("utf8")
+    if isinstance(parser, str):
+        if parser not in HTML_PARSERS:
+            names = ", ".join(f'"{name}"' for name in HTML_PARSERS)
+            raise ValueError(
+                f"unknown parser {parser!r}, expected one of {names} or a "
+                "callable"
+            )
+        parse = HTML_PARSERS[parser]
+    else:
+        parse = parser
+    # lxml tells full documents from fragments by looking at the start of
+    # the markup, which only works on bytes in ASCII compatible encodings
+    # (e.g. not UTF-16 or UTF-32).
+    bytes_parser = (
+        get_lxml_parser(encoding)
+        if html_bytes is not None
+        and parser == "lxml"
+        and "<div>".encode(encoding) == b"<div>"
+        else None
+    )
 
     try:
-        tree = lxml.html.fromstring(htmlb, parser=parser)
+        if bytes_parser is not None:
+            tree = lxml.html.fromstring(html_bytes, parser=bytes_parser)
+        else:
+            tree = parse(html_str)
     except lxml.etree.Error:
         # E.g. empty document. Use dummy <div>
         tree = lxml.html.fromstring("<div></div>")
@@ -224,39 +429,160 @@ def get_html_tree(html_str: str) -> Element:
     # If the document doesn't start with a top level tag, wrap it with a <div>
     # that will be later stripped out for consistent behavior.
     if tree.tag not in lxml.html.defs.top_level_tags:
-        htmlb = b"<div>" + htmlb + b"</div>"
-        tree = lxml.html.fromstring(htmlb, parser=parser)
+        if html_bytes is not None and bytes_parser is not None:
+            tree = lxml.html.fromstring(
+                b"<div>" + html_bytes + b"</div>", parser=bytes_parser
+            )
+        else:
+            tree = parse("<div>" + html_str + "</div>")
 
     # HACK: `:` and `@` in tag names (Outlook's <o:p>, or unescaped
     # <addr@domain> from a quoted reply header) crash slice_tree's XPath
-    # lookups later. Rewrite them here.
-    for el in list(tree.iter()):
-        if not isinstance(el.tag, str):
-            # comments / processing instructions
+    # lookups later. Rewrite them here. Only the affected elements are
+    # selected, and the selection is skipped if the markup can't have any.
+    if HTML_PREFIXED_TAG_RE.search(html_str):
+        _fix_prefixed_tags(tree)
+
+    return tree
+
+
+def get_html_tree_prefix(
+    html_str: str, is_complete: Callable[[Element], bool]
+) -> tuple[Element, int, list[Element]]:
+    """
+    Like get_html_tree(), but parses a full HTML document incrementally and
+    stops at the first chunk of markup after which is_complete() returns
+    True. is_complete() is called with a copy of the tree parsed so far, in
+    which the last line of text may not be complete yet.
+
+    Returns a tuple (tree, consumed, open_elements): The tree parsed from the
+    first `consumed` characters of the markup, and the elements of the tree
+    that weren't closed within them (outermost first). If the markup was
+    parsed completely, consumed equals the length of the markup.
+    """
+    parser = lxml.etree.HTMLPullParser(
+        events=("start",), tag="html", encoding="utf-8"
+    )
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+
+    root = None
+    has_prefixed_tags = False
+    consumed = 0
+    chunk_size = INITIAL_CHUNK_SIZE
+    while consumed < len(html_str):
+        end = _find_chunk_end(html_str, consumed, consumed + chunk_size)
+        chunk = html_str[consumed:end]
+        parser.feed(chunk.encode("utf8"))
+        consumed = end
+        chunk_size *= 2
+
+        has_prefixed_tags = has_prefixed_tags or bool(
+            HTML_PREFIXED_TAG_RE.search(chunk)
+        )
+        if root is None:
+            root = next((el for _, el in parser.read_events()), None)
+        if root is None or consumed == len(html_str):
             continue
 
+        tree = copy.deepcopy(root)
+        if has_prefixed_tags:
+            _fix_prefixed_tags(tree)
+        if is_complete(tree):
+            break
+
+    open_elements = []
+    if consumed < len(html_str):
+        # Text at the end of the consumed markup is only added to the tree
+        # once the parser sees the next tag. A marker comment also tells us
+        # which elements are still open.
+        parser.feed(f"<!--{PREFIX_END_MARKER}-->".encode())
+
+    tree = parser.close()
+
+    if consumed < len(html_str):
+        marker = tree
+        while len(marker):
+            marker = marker[-1]
+        if (
+            marker.tag is lxml.etree.Comment
+            and marker.text == PREFIX_END_MARKER
+        ):
+            open_elements = list(reversed(list(marker.iterancestors())))
+            marker.getparent().remove(marker)
+
+    if has_prefixed_tags:
+        _fix_prefixed_tags(tree)
+        # Tags with an "@" were dropped.
+        open_elements = [
+            el
+            for el in open_elements
+            if el is tree or el.getparent() is not None
+        ]
+
+    if consumed < len(html_str) and not is_complete(tree):
+        # The text added at the end changed the outcome.
+        return get_html_tree(html_str), len(html_str), []
+
+    return tree, consumed, open_elements
+
+
+def _find_chunk_end(html_str: str, start: int, min_end: int) -> int:
+    """
+    Return the position of the first tag at or after min_end in the given
+    markup, scanning from the start position, which must not be inside of a
+    tag, comment or raw text element. Whitespace preceding the tag is left
+    for the next chunk since the parser may drop it at the end of the input.
+    Returns the length of the markup if there is no such tag.
+    """
+    pos = start
+    while match := HTML_CHUNK_BOUNDARY_RE.search(html_str, pos):
+        if match.end() - match.start() == 1 and match.start() >= min_end:
+            end = match.start()
+            while end > start and html_str[end - 1].isspace():
+                end -= 1
+            return end
+        pos = match.end()
+    return len(html_str)
+
+
+def _fix_prefixed_tags(tree: Element) -> None:
+    """
+    Rename namespaced tags and tags with a ":" in their name to <span>,
+    storing the original name in the __tag_name attribute so that
+    render_html_tree() can restore it. Tags with an "@" are turned into text.
+    """
+    for el in tree.xpath(
+        "descendant-or-self::*[namespace::*[name() != 'xml']"
+        " or contains(name(), ':') or contains(name(), '@')]"
+    ):
         if el.nsmap:
             # Namespaced (e.g. <v:shape>): rename to <span>, restore on output.
             prefix = next(iter(el.nsmap.keys()))
             el.attrib["__tag_name"] = f"{prefix}:{el.tag}"
             el.tag = "span"
+        else:
+            _fix_prefixed_tag(el, el.tag)
 
-        elif ":" in el.tag:
-            # Outlook <o:p> padding: same treatment, round-tripped.
-            el.attrib["__tag_name"] = el.tag
-            el.tag = "span"
 
-        elif "@" in el.tag:
-            # Mail client forgot to escape <addr@domain>. Flatten back to
-            # visible text so the address actually renders.
-            attrs = "".join(
-                f' {k}="{html.escape(v, quote=True)}"'
-                for k, v in el.attrib.items()
-            )
-            el.text = f"<{el.tag}{attrs}>" + (el.text or "")
-            el.drop_tag()
-
-    return tree
+def _fix_prefixed_tag(el: Element, tag_name: str) -> None:
+    """
+    Fix up the given element whose actual tag name contains a ":" or "@"
+    (see _fix_prefixed_tags()).
+    """
+    if ":" in tag_name:
+        # Outlook <o:p> padding: same treatment, round-tripped.
+        el.attrib["__tag_name"] = tag_name
+        el.tag = "span"
+
+    elif "@" in tag_name:
+        # Mail client forgot to escape <addr@domain>. Flatten back to
+        # visible text so the address actually renders.
+        attrs = "".join(
+            f' {k}="{html.escape(v, quote=True)}"'
+            for k, v in el.attrib.items()
+        )
+        el.text = f"<{tag_name}{attrs}>" + (el.text or "")
+        el.drop_tag()
 
 
 def strip_wrapping(html_str: str) -> str:
@@ -268,22 +594,29 @@ def strip_wrapping(html_str: str) -> str:
     return html_str.strip()
 
 
-def render_html_tree(tree: Element) -> str:
+def render_html_tree(
+    tree: Element, open_elements: list[Element] | None = None
+) -> str:
     """
     Render the given HTML tree, and strip any wrapping that was applied in
     get_html_tree().
 
+    If open_elements (as returned by get_html_tree_prefix()) are given, their
+    end tags are left out so that the remaining markup can be appended.
+
     You should avoid further processing of the given tree after calling this
     method because we modify namespaced tags here.
     """
     # Restore any tag names that were changed in get_html_tree()
-    for el in tree.iter():
-        if "__tag_name" in el.attrib:
-            actual_tag_name = el.attrib.pop("__tag_name")
-            el.tag = actual_tag_name
+    for el in tree.xpath("descendant-or-self::*[@__tag_name]"):
+        el.tag = el.attrib.pop("__tag_name")
 
     html_str = lxml.html.tostring(tree, encoding="utf8").decode("utf8")
 
+    if open_elements:
+        end_tags = "".join(f"</{el.tag}>" for el in reversed(open_elements))
+        html_str = html_str.removesuffix(end_tags)
+
     return strip_wrapping(html_str)
 
 
@@ -301,31 +634,32 @@ def tree_token_generator(
 
     - A tuple (LXML element, Begin, indentation_level)
     - Text right after the start of the tag, or None.
-    - Recursively calls the token generator for all child objects
+    - The tokens for all child elements
     - A tuple (LXML element, End, indentation_level)
     - Text right after the end of the tag, or None.
+
+    The tree is walked iteratively (using lxml's iterwalk), so deeply nested
+    documents don't hit the recursion limit. Comments and processing
+    instructions are skipped, including the text following them.
     """
     if not isinstance(el.tag, str):
         return
 
-    is_indentation = is_indentation_element(el)
-
-    if is_indentation:
-        indentation_level += 1
-
-    yield (el, Position.Begin, indentation_level)
+    for event, child in lxml.etree.iterwalk(el, events=("start", "end")):
+        if event == "start":
+            if is_indentation_element(child):
+                indentation_level += 1
 
-    yield el.text
+            yield (child, Position.Begin, indentation_level)
 
-    for child in el.iterchildren():
-        yield from tree_token_generator(child, indentation_level)
-
-    if is_indentation:
-        indentation_level -= 1
+            yield child.text
+        else:
+            if is_indentation_element(child):
+                indentation_level -= 1
 
-    yield (el, Position.End, indentation_level)
+            yield (child, Position.End, indentation_level)
 
-    yield el.tail
+            yield child.tail
 
 
 def tree_line_generator(
@@ -1,10 +1,32 @@
+import codecs
+import re
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from functools import partial
+from html import unescape
+from itertools import chain, islice
+from typing import overload
+
 from typing_extensions import assert_never
 
 from ._enums import Position
 from ._patterns import (
+    COMBINED_PATTERN_RE,
     COMPILED_PATTERN_MAP,
+    FORWARD_STYLE_KEYWORD_RE,
+    HEADER_LINE_RE,
     HEADER_MAP,
     HEADER_RE,
+    HTML_HEADER_RE,
+    HTML_LINE_BREAK_RE,
+    HTML_RAW_TEXT_TAG_RE,
+    HTML_TAG_RE,
+    HTML_TEXT_RE,
+    INDENTATION_TAG_RE,
+    MIN_HEADER_LINES,
+    MIN_QUOTED_LINES,
+    PATTERN_KEYWORD_RE,
+    PATTERNS,
     REPLY_DATE_SPLIT_REGEX,
     STRIP_SPACE_CHARS,
 )
@@ -15,49 +37,349 @@ documentation see the corresponding constants in _patterns.py.
 """
 
 
+def unindent_line(line: str, level: int = 1) -> str:
+    """
+    Remove up to the given number of quoting levels ("> " or ">") from the
+    beginning of the line.
+    """
+    pos = 0
+    for _ in range(level):
+        if line.startswith("> ", pos):
+            pos += 2
+        elif line.startswith(">", pos):
+            pos += 1
+        else:
+            break
+    return line[pos:] if pos else line
+
+
+class LineView(Sequence[str]):
+    """
+    Read-only view of lines[start:stop] with the given number of quoting
+    levels removed from each line (see unindent_line), which doesn't copy the
+    underlying list. Slicing a view returns another view of the same lines,
+    and a view of a view refers to the original lines directly.
+    """
+
+    __slots__ = ("level", "lines", "start", "stop")
+
+    lines: Sequence[str]
+    start: int
+    stop: int
+    level: int
+
+    def __init__(
+        self,
+        lines: Sequence[str],
+        start: int = 0,
+        stop: int | None = None,
+        level: int = 0,
+    ) -> None:
+        indices = range(len(lines))[start:stop]
+        if isinstance(lines, LineView):
+            indices = range(lines.start, lines.stop)[start:stop]
+            level += lines.level
+            lines = lines.lines
+        self.lines = lines
+        self.start = indices.start
+        self.stop = max(indices.start, indices.stop)
+        self.level = level
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    @overload
+    def __getitem__(self, key: int) -> str: ...
+
+    @overload
+    def __getitem__(self, key: slice) -> "LineView": ...
+
+    def __getitem__(self, key: int | slice) -> "str | LineView":
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError("LineView slices don't support steps")
+            return LineView(self, key.start or 0, key.stop)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("LineView index out of range")
+        line = self.lines[self.start + key]
+        return unindent_line(line, self.level) if self.level else line
+
+    def __iter__(self) -> Iterator[str]:
+        lines = self.lines
+        level = self.level
+        for n in range(self.start, self.stop):
+            yield unindent_line(lines[n], level) if level else lines[n]
+
+    def __repr__(self) -> str:
+        return (
+            f"LineView(<{len(self.lines)} lines>, {self.start}, "
+            f"{self.stop}, level={self.level})"
+        )
+
+
+class StrippedLines(Sequence[str]):
+    """
+    Read-only view of the lines of "\n".join(view).strip(), where view is a
+    LineView(lines, start, stop, level), without joining and splitting them:
+    Blank lines are skipped at both ends, and only the stripped first and last
+    lines are stored. A view of a view refers to the original lines directly,
+    along with the stripped lines of the outer views that it includes.
+    """
+
+    __slots__ = ("depths", "edges", "level", "lines", "start", "stop")
+
+    lines: Sequence[str]
+    start: int
+    stop: int
+    level: int
+    edges: dict[int, str]
+    depths: "QuoteDepths"
+
+    def __init__(
+        self,
+        lines: Sequence[str],
+        start: int = 0,
+        stop: int | None = None,
+        level: int = 0,
+    ) -> None:
+        indices = range(len(lines))[start:stop]
+        self.edges = {}
+        if isinstance(lines, StrippedLines):
+            indices = range(lines.start, lines.stop)[start:stop]
+            self.edges = {
+                n: unindent_line(line, level)
+                for n, line in lines.edges.items()
+                if n in indices
+            }
+            level += lines.level
+            self.depths = lines.depths
+            lines = lines.lines
+        else:
+            self.depths = QuoteDepths(lines)
+        self.lines = lines
+        self.level = level
+
+        start = indices.start
+        stop = max(indices.start, indices.stop)
+        while start < stop and not self._line(start).strip():
+            start += 1
+        while stop > start and not self._line(stop - 1).strip():
+            stop -= 1
+        if start < stop:
+            first = self._line(start).lstrip()
+            last = self._line(stop - 1).rstrip()
+            self.edges[start] = first.rstrip() if start == stop - 1 else first
+            if start < stop - 1:
+                self.edges[stop - 1] = last
+        self.start = start
+        self.stop = stop
+
+    def _line(self, n: int) -> str:
+        if n in self.edges:
+            return self.edges[n]
+        line = self.lines[n]
+        return unindent_line(line, self.level) if self.level else line
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    @overload
+    def __getitem__(self, key: int) -> str: ...
+
+    @overload
+    def __getitem__(self, key: slice) -> LineView: ...
+
+    def __getitem__(self, key: int | slice) -> "str | LineView":
+        if isinstance(key, slice):
+            return LineView(self)[key]
+        n = (self.start if key >= 0 else self.stop) + key
+        if not self.start <= n < self.stop:
+            raise IndexError("StrippedLines index out of range")
+        edge = self.edges.get(n)
+        if edge is not None:
+            return edge
+        line = self.lines[n]
+        return unindent_line(line, self.level) if self.level else line
+
+    def __iter__(self) -> Iterator[str]:
+        for n in range(self.start, self.stop):
+            yield self._line(n)
+
+
+class WindowCache:
+    """
+    Per-document cache of the candidate strings that reply/forward patterns
+    are matched against. A candidate for (n, m) is line n joined with the m
+    following lines (see join_wrapped_lines), with a leading ">" removed and
+    surrounding whitespace stripped. Each candidate is built once and shared
+    between all patterns and between neighbouring lookups of the same
+    document. The document's header blocks are kept here as well.
+    """
+
+    def __init__(self, lines: Sequence[str]) -> None:
+        self.lines = lines
+        self._joined: dict[tuple[int, int], str] = {}
+        self._candidates: dict[tuple[int, int], str | None] = {}
+        self._keywords: dict[int, bool] = {}
+        self._header_runs: dict[int, HeaderRuns] = {}
+        self._quote_runs: QuoteRuns | None = None
+
+    def header_runs(self, max_wrap_lines: int) -> "HeaderRuns":
+        """
+        Return the HeaderRuns of the lines for the given max_wrap_lines.
+        """
+        runs = self._header_runs.get(max_wrap_lines)
+        if runs is None:
+            runs = HeaderRuns(self.lines, max_wrap_lines)
+            self._header_runs[max_wrap_lines] = runs
+        return runs
+
+    def quote_runs(self) -> "QuoteRuns":
+        """
+        Return the QuoteRuns of the lines.
+        """
+        if self._quote_runs is None:
+            if isinstance(self.lines, StrippedLines):
+                self._quote_runs = StrippedQuoteRuns(self.lines)
+            else:
+                self._quote_runs = QuoteRuns(self.lines)
+        return self._quote_runs
+
+    def first_keyword_line(self, n: int, max_wrap_lines: int) -> int | None:
+        """
+        Return the smallest m < max_wrap_lines for which line n + m contains
+        a pattern keyword (see PATTERN_KEYWORD_RE), or None. Since keywords
+        can't be split up by joining wrapped lines, no pattern can match a
+        window (n, m) unless this returns a value of at most m.
+        """
+        if PATTERN_KEYWORD_RE is None:
+            return 0
+        for m in range(min(max_wrap_lines, len(self.lines) - n)):
+            has_keyword = self._keywords.get(n + m)
+            if has_keyword is None:
+                has_keyword = bool(
+                    PATTERN_KEYWORD_RE.search(self.lines[n + m])
+                )
+                self._keywords[n + m] = has_keyword
+            if has_keyword:
+                return m
+        return None
+
+    def joined(self, n: int, m: int) -> str:
+        """
+        Return join_wrapped_lines(lines[n : n + 1 + m]), extending the cached
+        join of the previous wrap width by one line.
+        """
+        key = (n, m)
+        joined = self._joined.get(key)
+        if joined is None:
+            if m == 0:
+                joined = self.lines[n]
+            else:
+                joined = self.joined(n, m - 1)
+                if n + m < len(self.lines):
+                    if not joined or joined[-1] not in STRIP_SPACE_CHARS:
+                        joined += " "
+                    joined += self.lines[n + m]
+            self._joined[key] = joined
+        return joined
+
+    def candidate(self, n: int, m: int) -> str | None:
+        """
+        Return the stripped candidate for the given window, or None if the
+        window is blank (after removing a leading ">"), in which case no
+        pattern can match on this line.
+        """
+        key = (n, m)
+        try:
+            return self._candidates[key]
+        except KeyError:
+            pass
+
+        match_line = self.joined(n, m)
+        if match_line.startswith(">"):
+            match_line = match_line[1:].strip()
+        candidate = match_line.strip() if match_line else None
+        self._candidates[key] = candidate
+        return candidate
+
+
+def match_pattern(line: str) -> tuple[int, str] | None:
+    """
+    Match the given line against all reply and forward patterns at once.
+
+    Returns a tuple with the index of the first matching pattern in PATTERNS
+    and its type ('reply' or 'forward'), or None if no pattern matches.
+    """
+    match = COMBINED_PATTERN_RE.match(line)
+    if not match:
+        return None
+    idx = int(match.lastgroup[1:])  # type: ignore[index]
+    return idx, PATTERNS[idx][0]
+
+
 def find_pattern_on_line(
-    lines: list[str],
+    lines: Sequence[str],
     n: int,
     max_wrap_lines: int,
     position: Position,
+    cache: WindowCache | None = None,
 ) -> tuple[int, str] | None:
     """
     Find a forward/reply pattern within the given lines on text on the given
     line number and return a tuple with the type ('reply' or 'forward') and
     line number of where the pattern ends. The returned line number may be
     different from the given line number in case the pattern wraps over
-    multiple lines.
+    multiple lines. An optional WindowCache for the lines may be passed to
+    share candidates between calls.
 
     Returns None if no pattern was found.
     """
-    for typ, regexes in COMPILED_PATTERN_MAP.items():
-        for regex in regexes:
-            for m in range(max_wrap_lines):
-                match_line = join_wrapped_lines(lines[n : n + 1 + m])
-                if match_line.startswith(">"):
-                    match_line = match_line[1:].strip()
-                # If this line is blank, break out of the innermost loop
-                # at m == 0 so that if the quoting starts in the following
-                # line, we'll correctly detect the start of the quoting
-                # position.
-                if not match_line:
-                    break
-                if regex.match(match_line.strip()):
-                    match position:
-                        case Position.Begin:
-                            return n, typ
-                        case Position.End:
-                            return n + m, typ
-                        case _:
-                            assert_never(position)
-    return None
+    if cache is None:
+        cache = WindowCache(lines)
+
+    # Skip the regexes entirely for windows without a keyword.
+    first_m = cache.first_keyword_line(n, max_wrap_lines)
+    if first_m is None:
+        return None
+
+    found = None
+    for m in range(max_wrap_lines):
+        match_line = cache.candidate(n, m)
+        # If this line is blank, break out of the loop at m == 0 so that if
+        # the quoting starts in the following line, we'll correctly detect
+        # the start of the quoting position.
+        if match_line is None:
+            break
+        if m < first_m:
+            continue
+        result = match_pattern(match_line)
+        # Patterns take precedence over wrapping: a pattern that only matches
+        # when wrapped wins over a later pattern matching on fewer lines.
+        if result and (found is None or result[0] < found[0]):
+            found = result[0], result[1], m
+
+    if found is None:
+        return None
+
+    _, typ, m = found
+    match position:
+        case Position.Begin:
+            return n, typ
+        case Position.End:
+            return n + m, typ
+        case _:
+            assert_never(position)
 
 
 def find_quote_position(
-    lines: list[str],
+    lines: Sequence[str],
     max_wrap_lines: int,
     limit: int | None = None,
     position: Position = Position.End,
+    cache: WindowCache | None = None,
 ) -> int | None:
     """
     Return the beginning or ending line number of a quoting pattern.
@@ -69,18 +391,96 @@ def find_quote_position(
         limit: If line limit is given and reached without finding a pattern,
             the limit is returned.
         position: Whether to return the beginning or ending line number.
+        cache: Optional WindowCache for the lines.
     """
+    if cache is None:
+        cache = WindowCache(lines)
+
     for n in range(len(lines)):
-        result = find_pattern_on_line(lines, n, max_wrap_lines, position)
+        result = find_pattern_on_line(
+            lines, n, max_wrap_lines, position, cache
+        )
+        if result:
+            return result[0]
+        if limit is not None and n >= limit - 1:
+            return n
+
+    return None
+
+
+class LineStream:
+    """
+    Lines read lazily from an iterable of lines, e.g. a file object. The raw
+    lines are kept as they were read, while lines has the line endings
+    removed, so that it matches text.split("\n") for the text read so far.
+    """
+
+    def __init__(self, iterable: Iterable[str]) -> None:
+        self._iterator = iter(iterable)
+        self.raw: list[str] = []
+        self.lines: list[str] = []
+        self.exhausted = False
+
+    def load(self, count: int) -> int:
+        """
+        Read lines until at least count lines are loaded or the iterable is
+        exhausted. Returns the number of loaded lines.
+        """
+        while len(self.lines) < count and not self.exhausted:
+            line = next(self._iterator, None)
+            if line is None:
+                self.exhausted = True
+                # Like str.split(), end with an empty line after a trailing
+                # newline (or if there weren't any lines at all).
+                if not self.raw or self.raw[-1].endswith("\n"):
+                    self.lines.append("")
+                break
+            self.raw.append(line)
+            self.lines.append(line.removesuffix("\n"))
+        return len(self.lines)
+
+    def offset(self, n: int) -> int:
+        """
+        Return the number of characters read before line n.
+        """
+        return sum(map(len, islice(self.raw, n)))
+
+    def rest(self, n: int) -> Iterator[str]:
+        """
+        Return an iterator over the raw lines starting at line n, including
+        the ones that weren't read yet.
+        """
+        return chain(self.raw[n:], self._iterator)
+
+
+def find_quote_position_stream(
+    stream: LineStream,
+    max_wrap_lines: int,
+    limit: int | None = None,
+    position: Position = Position.End,
+) -> int | None:
+    """
+    Like find_quote_position(), but takes a LineStream and only reads as many
+    lines as needed to find the position or to reach the limit.
+    """
+    cache = WindowCache(stream.lines)
+
+    n = 0
+    # Load all lines that a wrapped pattern on line n could span.
+    while n < stream.load(n + max_wrap_lines):
+        result = find_pattern_on_line(
+            stream.lines, n, max_wrap_lines, position, cache
+        )
         if result:
             return result[0]
         if limit is not None and n >= limit - 1:
             return n
+        n += 1
 
     return None
 
 
-def join_wrapped_lines(lines: list[str]) -> str:
+def join_wrapped_lines(lines: Sequence[str]) -> str:
     """
     Join one or multiple lines that wrapped. Returns the reconstructed line.
     Takes into account proper spacing between the lines (see
@@ -101,7 +501,7 @@ def join_wrapped_lines(lines: list[str]) -> str:
 
 
 def extract_headers(
-    lines: list[str], max_wrap_lines: int
+    lines: Sequence[str], max_wrap_lines: int
 ) -> tuple[dict[str, str], int]:
     """
     Extract email headers from the given lines. Returns a dict with the
@@ -143,6 +543,277 @@ def extract_headers(
     return hdrs, lines_processed
 
 
+def parse_header_name(line: str) -> str | None:
+    """
+    Return the lowercased header name if the line matches HEADER_RE, or None.
+    """
+    match = HEADER_RE.match(line)
+    return match.group(1).strip().lower() if match else None
+
+
+# Bit for each header that extract_headers() recognizes, so that the distinct
+# headers of a block can be tracked as a mask.
+HEADER_BITS = {
+    header: 1 << i
+    for i, header in enumerate(dict.fromkeys(HEADER_MAP.values()))
+}
+
+
+class HeaderRuns:
+    """
+    Per-document table of the header blocks that extract_headers() would find
+    when starting at a given line, computed lazily.
+
+    A block starting at a header line either ends before the next header line
+    or continues exactly like the block starting at that line, since matching
+    a header resets extract_headers()' state. Each block is therefore stored
+    as its own header bit plus a link to the following block, and every line
+    is looked at once no matter how many blocks are queried.
+    """
+
+    def __init__(self, lines: Sequence[str], max_wrap_lines: int) -> None:
+        self.lines = lines
+        self.max_wrap_lines = max_wrap_lines
+        self._names: dict[int, str | None] = {}
+        # Line number -> (header mask, end of the block)
+        self._blocks: dict[int, tuple[int, int]] = {}
+
+    def header_name(self, n: int) -> str | None:
+        """
+        Return the lowercased header name if line n matches HEADER_RE, or
+        None.
+        """
+        try:
+            return self._names[n]
+        except KeyError:
+            pass
+        name = parse_header_name(self.lines[n])
+        self._names[n] = name
+        return name
+
+    def block(self, n: int) -> tuple[int, int]:
+        """
+        Return a tuple (header mask, end) for the block extract_headers()
+        finds in lines[n:]: The bits (see HEADER_BITS) of the recognized
+        headers, and the line number after the last processed line (n if
+        nothing was processed).
+        """
+        lines = self.lines
+        # Leading blank lines are skipped, anything else ends the block.
+        start = n
+        while start < len(lines) and not lines[start].strip():
+            start += 1
+        if start == len(lines) or self.header_name(start) is None:
+            return 0, n
+
+        # Follow the links until a known block or the end of the run, then
+        # resolve the visited blocks backwards.
+        chain = []
+        block = None
+        line_n: int | None = start
+        while line_n is not None:
+            block = self._blocks.get(line_n)
+            if block is not None:
+                break
+            bit, end, next_line_n = self._scan_block(line_n)
+            chain.append((line_n, bit, end))
+            line_n = next_line_n
+        for line_n, bit, end in reversed(chain):
+            block = (bit | block[0], block[1]) if block else (bit, end)
+            self._blocks[line_n] = block
+        assert block is not None
+        return block
+
+    def _scan_block(self, n: int) -> tuple[int, int, int | None]:
+        """
+        Scan the block starting at header line n up to the next header line.
+        Returns the header bit of line n, the line number after the last
+        processed line, and the next header line if the block continues
+        there (or None).
+        """
+        lines = self.lines
+        name = self.header_name(n)
+        header_name = name
+        mapped = HEADER_MAP.get(name) if name is not None else None
+        bit = HEADER_BITS[mapped] if mapped else 0
+        extend_lines = 0
+        end = n + 1
+        for i in range(n + 1, len(lines)):
+            if not lines[i].strip():
+                header_name = None
+                continue
+            if self.header_name(i) is not None:
+                return bit, end, i
+            extend_lines += 1
+            if extend_lines >= self.max_wrap_lines or (
+                header_name not in HEADER_MAP
+            ):
+                break
+            end = i + 1
+        return bit, end, None
+
+    def header_count(self, n: int) -> int:
+        """
+        Return the number of headers extract_headers() finds in lines[n:].
+        """
+        return self.block(n)[0].bit_count()
+
+    def extract(self, n: int) -> tuple[dict[str, str], int]:
+        """
+        Return extract_headers(lines[n:]), only looking at the lines of the
+        block.
+        """
+        end = self.block(n)[1]
+        hdrs, _ = extract_headers(
+            LineView(self.lines, n, end), self.max_wrap_lines
+        )
+        return hdrs, end - n
+
+
+class QuoteRuns:
+    """
+    Per-document table of the quote depth of each line and of the quoted runs
+    starting at each line, computed lazily. Every line of a run is filled in
+    when the run is first looked at, so each line is scanned once.
+    """
+
+    def __init__(self, lines: Sequence[str]) -> None:
+        self.lines = lines
+        self._depths: list[int | None] = [None] * len(lines)
+        self._runs: list[int | None] = [None] * len(lines)
+        self._counts: list[int | None] = [None] * len(lines)
+
+    def depth(self, n: int) -> int:
+        """
+        Return how many times line n can be unindented by unindent_lines()
+        (e.g. 2 for "> > text" or ">>text").
+        """
+        depth = self._depths[n]
+        if depth is None:
+            line = self.lines[n]
+            depth = pos = 0
+            while line.startswith(">", pos):
+                depth += 1
+                pos += 2 if line.startswith("> ", pos) else 1
+            self._depths[n] = depth
+        return depth
+
+    def run_length(self, n: int) -> int:
+        """
+        Return the number of consecutive quoted lines starting at line n, i.e.
+        the amount of lines unindent_lines(lines[n:]) returns.
+        """
+        lines = self.lines
+        end = n
+        while (
+            end < len(lines)
+            and self._runs[end] is None
+            and self.depth(end) > 0
+        ):
+            end += 1
+        run = (self._runs[end] or 0) if end < len(lines) else 0
+        for i in range(end - 1, n - 1, -1):
+            run += 1
+            self._runs[i] = run
+        return run
+
+    def quoted_count(self, n: int, limit: int | None = None) -> int:
+        """
+        Return the number of quoted lines starting at line n, skipping blank
+        lines, until the first line that is neither quoted nor blank. If a
+        limit is given, counting stops once the limit is reached.
+        """
+        lines = self.lines
+        end = n
+        count = 0
+        while end < len(lines) and self._counts[end] is None:
+            line = lines[end]
+            if line.startswith(">"):
+                count += 1
+                if limit is not None and count >= limit:
+                    # The count is incomplete, so don't store it.
+                    return count
+            elif line.strip():
+                break
+            end += 1
+        count = (self._counts[end] or 0) if end < len(lines) else 0
+        for i in range(end - 1, n - 1, -1):
+            if lines[i].startswith(">"):
+                count += 1
+            self._counts[i] = count
+        return count if limit is None else min(count, limit)
+
+
+class QuoteDepths:
+    """
+    Quote depths (see QuoteRuns.depth) of all lines of a document, capped at
+    MAX_DEPTH and stored as a bytearray when first needed, so that the end of
+    a quoted run at any level is found with a single regex search.
+    """
+
+    MAX_DEPTH = 255
+
+    def __init__(self, lines: Sequence[str]) -> None:
+        self.lines = lines
+        self._table: bytearray | None = None
+        self._end_res: dict[int, re.Pattern[bytes]] = {}
+
+    def table(self) -> bytearray:
+        if self._table is None:
+            runs = QuoteRuns(self.lines)
+            self._table = bytearray(
+                min(runs.depth(n), self.MAX_DEPTH)
+                for n in range(len(self.lines))
+            )
+        return self._table
+
+    def run_end(self, start: int, stop: int, level: int) -> int:
+        """
+        Return the first line from start on (and before stop) that is quoted
+        at most level times, or stop if there is none. The level must be
+        below MAX_DEPTH.
+        """
+        end_re = self._end_res.get(level)
+        if end_re is None:
+            end_re = re.compile(b"[\\x00-%s]" % re.escape(bytes([level])))
+            self._end_res[level] = end_re
+        match = end_re.search(self.table(), start, stop)
+        return match.start() if match else stop
+
+
+class StrippedQuoteRuns(QuoteRuns):
+    """
+    QuoteRuns of StrippedLines. Unindenting a line by some levels removes as
+    many levels from its quote depth, so run lengths are looked up in the
+    QuoteDepths of the original lines, which all levels of a thread share,
+    rather than by unindenting each line again. Only the stripped edges of the
+    levels are looked at separately.
+    """
+
+    lines: "StrippedLines"
+
+    def run_length(self, n: int) -> int:
+        lines = self.lines
+        if lines.level >= QuoteDepths.MAX_DEPTH:
+            return super().run_length(n)
+        if self.depth(n) == 0:
+            return 0
+        pos = lines.start + n
+        while True:
+            end = lines.depths.run_end(pos, lines.stop, lines.level)
+            edges = [
+                e for e in lines.edges if pos <= e <= end and e < lines.stop
+            ]
+            if not edges:
+                break
+            edge = min(edges)
+            if self.depth(edge - lines.start) == 0:
+                end = edge
+                break
+            pos = edge + 1
+        return end - lines.start - n
+
+
 def parse_reply(line: str) -> dict[str, str] | None:
     """
     Parse the given reply line ("On DATE, USER wrote:") and returns a
@@ -188,10 +859,11 @@ def parse_reply(line: str) -> dict[str, str] | None:
 
 
 def find_unwrap_start(
-    lines: list[str],
+    lines: Sequence[str],
     max_wrap_lines: int,
     min_header_lines: int,
     min_quoted_lines: int,
+    cache: WindowCache | None = None,
 ) -> tuple[int, int, str] | None:
     """
     Find the starting point of a wrapped email. Returns a tuple containing
@@ -209,49 +881,161 @@ def find_unwrap_start(
     multiple lines (it does not extend to the end of the headers or of the
     quoted section).
 
+    An optional WindowCache for the lines may be passed to share pattern
+    candidates and header blocks with other lookups on the same lines.
+
     Returns None if nothing was found.
     """
+    if cache is None:
+        cache = WindowCache(lines)
+    runs = cache.header_runs(max_wrap_lines)
+
     for n, line in enumerate(lines):
         if not line.strip():
             continue
 
         # Find a forward / reply start pattern
 
-        result = find_pattern_on_line(lines, n, max_wrap_lines, Position.End)
+        result = find_pattern_on_line(
+            lines, n, max_wrap_lines, Position.End, cache
+        )
         if result:
             end, typ = result
             return n, end, typ
 
-        # Find a quote
-        if line.startswith(">"):
-            # Check if there are at least min_quoted_lines lines that match
-            matched_lines = 1
-
-            if matched_lines >= min_quoted_lines:
-                return n, n, "quoted"
-
-            for peek_line in lines[n + 1 :]:
-                if not peek_line.strip():
-                    continue
-                if not peek_line.startswith(">"):
-                    break
-                matched_lines += 1
-                if matched_lines >= min_quoted_lines:
-                    return n, n, "quoted"
+        # Find a quote: Check if there are at least min_quoted_lines quoted
+        # lines, ignoring blank lines.
+        if (
+            line.startswith(">")
+            and cache.quote_runs().quoted_count(n, min_quoted_lines)
+            >= min_quoted_lines
+        ):
+            return n, n, "quoted"
 
         # Find a header
-        match = HEADER_RE.match(line)
         if (
-            match
-            and len(extract_headers(lines[n:], max_wrap_lines)[0])
-            >= min_header_lines
+            runs.header_name(n) is not None
+            and runs.header_count(n) >= min_header_lines
         ):
             return n, n, "headers"
 
     return None
 
 
-def unindent_lines(lines: list[str]) -> list[str]:
+def find_parent_quote(
+    lines: Sequence[str], parent_lines: Sequence[str], min_lines: int
+) -> int | None:
+    """
+    Return the number of the first line where min_lines consecutive lines,
+    with one level of quoting removed, match min_lines consecutive lines of
+    the parent message, ignoring surrounding whitespace. Matching windows must
+    start and end with a non-blank line.
+
+    The parent's windows are put into a set, and the lines are compared with
+    it in a single pass, so this takes linear time.
+
+    Returns None if no window matches.
+    """
+    parent = [line.strip() for line in parent_lines]
+    windows = {
+        tuple(parent[n : n + min_lines])
+        for n in range(len(parent) - min_lines + 1)
+        if parent[n] and parent[n + min_lines - 1]
+    }
+    if not windows:
+        return None
+
+    window: deque[str] = deque(maxlen=min_lines)
+    for n, line in enumerate(lines):
+        window.append(unindent_line(line).strip())
+        if (
+            len(window) == min_lines
+            and window[0]
+            and window[-1]
+            and tuple(window) in windows
+        ):
+            return n - min_lines + 1
+    return None
+
+
+def find_parent_start(
+    lines: Sequence[str],
+    parent_lines: Sequence[str],
+    max_wrap_lines: int,
+    min_quoted_lines: int,
+    cache: WindowCache | None = None,
+) -> tuple[int, int, str] | None:
+    """
+    Like find_unwrap_start(), but find where the given parent message is
+    quoted instead of looking for patterns on every line.
+
+    If the lines that match the parent are quoted, the start of the quoted
+    section (which may contain blank lines) is returned with the type
+    'quoted', or the reply/forward pattern if one ends on the last non-blank
+    line before it.
+
+    Returns None if the parent isn't quoted.
+    """
+    n = find_parent_quote(lines, parent_lines, min_quoted_lines)
+    if n is None or not lines[n].startswith(">"):
+        return None
+    if cache is None:
+        cache = WindowCache(lines)
+
+    # Find the start of the quoted section, which may contain blank lines.
+    start = m = n
+    while m > 0 and (lines[m - 1].startswith(">") or not lines[m - 1].strip()):
+        m -= 1
+        if lines[m].startswith(">"):
+            start = m
+
+    end = start - 1
+    while end >= 0 and not lines[end].strip():
+        end -= 1
+    for m in range(max(end - max_wrap_lines + 1, 0), end + 1):
+        result = find_pattern_on_line(
+            lines, m, max_wrap_lines, Position.End, cache
+        )
+        if result and result[0] == end:
+            return m, end, result[1]
+
+    return start, start, "quoted"
+
+
+def find_parent_position(
+    lines: Sequence[str],
+    parent_lines: Sequence[str],
+    max_wrap_lines: int,
+    limit: int | None = None,
+    position: Position = Position.End,
+) -> int | None:
+    """
+    Like find_quote_position(), but use the quoted parent message (see
+    find_parent_start) to find the quoting. Without a reply/forward pattern,
+    the quoting starts after the last non-blank line before the quoted
+    section.
+
+    Returns None if the parent isn't quoted.
+    """
+    result = find_parent_start(
+        lines, parent_lines, max_wrap_lines, MIN_QUOTED_LINES
+    )
+    if result is None:
+        return None
+
+    start, end, typ = result
+    if typ == "quoted":
+        while start > 0 and not lines[start - 1].strip():
+            start -= 1
+        # Split before the line after the text, like after a pattern.
+        end = start - 1
+    found = start if position == Position.Begin else end
+    if limit is not None:
+        found = min(found, limit - 1)
+    return found
+
+
+def unindent_lines(lines: Sequence[str]) -> list[str]:
     unquoted = []
     for line in lines:
         if line.startswith("> "):
@@ -265,10 +1049,11 @@ def unindent_lines(lines: list[str]) -> list[str]:
 
 
 def unwrap(
-    lines: list[str],
+    lines: Sequence[str],
     max_wrap_lines: int,
     min_header_lines: int,
     min_quoted_lines: int,
+    unwrap_start: tuple[int, int, str] | None = None,
 ) -> (
     tuple[
         str,
@@ -288,12 +1073,17 @@ def unwrap(
     - Range of the text of the wrapped message (or None)
     - Range of the text below the wrapped message (or None)
     - Whether the wrapped text needs to be unindented
+
+    The (start line number, end line number, type) tuple that
+    find_unwrap_start() returns may be passed as unwrap_start if it's
+    already known, e.g. from find_parent_start().
     """
     headers = {}
+    cache = WindowCache(lines)
 
     # Get line number and wrapping type.
-    result = find_unwrap_start(
-        lines, max_wrap_lines, min_header_lines, min_quoted_lines
+    result = unwrap_start or find_unwrap_start(
+        lines, max_wrap_lines, min_header_lines, min_quoted_lines, cache
     )
     if not result:
         return None
@@ -305,16 +1095,14 @@ def unwrap(
         main_type = typ
 
         if typ == "reply":
-            reply_headers = parse_reply(
-                join_wrapped_lines(lines[start : end + 1])
-            )
+            reply_headers = parse_reply(cache.joined(start, end - start))
             if reply_headers:
                 headers.update(reply_headers)
 
         # Find where the headers or the quoted section starts.
         # We can set min_quoted_lines to 1 because we expect a quoted section.
         result = find_unwrap_start(
-            lines[end + 1 :], max_wrap_lines, min_header_lines, 1
+            LineView(lines, end + 1), max_wrap_lines, min_header_lines, 1
         )
         start2 = result[0] if result else 0
         typ2 = result[2] if result else None
@@ -322,17 +1110,24 @@ def unwrap(
         if typ2 == "quoted":
             # Quoted section starts. Unindent and check if there are headers.
             quoted_start = end + 1 + start2
-            unquoted = unindent_lines(lines[quoted_start:])
-            rest_start = quoted_start + len(unquoted)
+            rest_start = quoted_start + cache.quote_runs().run_length(
+                quoted_start
+            )
+            unquoted = LineView(lines, quoted_start, rest_start, level=1)
+            unquoted_cache = WindowCache(unquoted)
             result = find_unwrap_start(
-                unquoted, max_wrap_lines, min_header_lines, min_quoted_lines
+                unquoted,
+                max_wrap_lines,
+                min_header_lines,
+                min_quoted_lines,
+                unquoted_cache,
             )
             start3 = result[0] if result else 0
             typ3 = result[2] if result else None
             if typ3 == "headers":
-                hdrs, hdrs_length = extract_headers(
-                    unquoted[start3:], max_wrap_lines
-                )
+                hdrs, hdrs_length = unquoted_cache.header_runs(
+                    max_wrap_lines
+                ).extract(start3)
                 if hdrs:
                     headers.update(hdrs)
                 rest2_start = quoted_start + start3 + hdrs_length
@@ -354,8 +1149,8 @@ def unwrap(
             )
 
         if typ2 == "headers":
-            hdrs, hdrs_length = extract_headers(
-                lines[start + 1 :], max_wrap_lines
+            hdrs, hdrs_length = cache.header_runs(max_wrap_lines).extract(
+                start + 1
             )
             if hdrs:
                 headers.update(hdrs)
@@ -383,24 +1178,29 @@ def unwrap(
     # We just found headers, which usually indicates a forwarding.
     if typ == "headers":
         main_type = "forward"
-        hdrs, hdrs_length = extract_headers(lines[start:], max_wrap_lines)
+        hdrs, hdrs_length = cache.header_runs(max_wrap_lines).extract(start)
         rest_start = start + hdrs_length
         return main_type, (0, start), hdrs, (rest_start, None), None, False
 
     # We found quoted text. Headers may be within the quoted text.
     if typ == "quoted":
-        unquoted = unindent_lines(lines[start:])
-        rest_start = start + len(unquoted)
+        rest_start = start + cache.quote_runs().run_length(start)
+        unquoted = LineView(lines, start, rest_start, level=1)
+        unquoted_cache = WindowCache(unquoted)
         result = find_unwrap_start(
-            unquoted, max_wrap_lines, min_header_lines, min_quoted_lines
+            unquoted,
+            max_wrap_lines,
+            min_header_lines,
+            min_quoted_lines,
+            unquoted_cache,
         )
         start2 = result[0] if result else 0
         typ2 = result[2] if result else None
         if typ2 == "headers":
             main_type = "forward"
-            hdrs, hdrs_length = extract_headers(
-                unquoted[start2:], max_wrap_lines
-            )
+            hdrs, hdrs_length = unquoted_cache.header_runs(
+                max_wrap_lines
+            ).extract(start2)
             rest2_start = start + hdrs_length
             return (
                 main_type,
@@ -422,3 +1222,241 @@ def unwrap(
         )
 
     raise RuntimeError(f"invalid type: {typ}")
+
+
+def unwrap_thread(
+    lines: Sequence[str],
+    max_wrap_lines: int,
+    min_header_lines: int,
+    min_quoted_lines: int,
+) -> list[
+    tuple[
+        Sequence[str],
+        tuple[
+            str,
+            tuple[int | None, int | None],
+            dict[str, str] | None,
+            tuple[int | None, int | None] | None,
+            tuple[int | None, int | None] | None,
+            bool,
+        ],
+    ]
+]:
+    """
+    Unwrap the lines, then the text of the wrapped message, and so on, like
+    calling unwrap() again on the text of each wrapped message, but on views
+    of the given lines instead of joined texts. Returns a list of tuples of
+    the lines of each wrapped level and the result of unwrap() for them.
+    """
+    levels = []
+    while True:
+        result = unwrap(
+            lines, max_wrap_lines, min_header_lines, min_quoted_lines
+        )
+        if not result:
+            break
+        levels.append((lines, result))
+
+        main_range, needs_unindent = result[3], result[5]
+        if not main_range:
+            break
+        start, stop = main_range
+        inner = StrippedLines(
+            lines, start or 0, stop, level=int(needs_unindent)
+        )
+        # Stop at an empty message, or if nothing would change anymore.
+        if not inner or (len(inner) == len(lines) and not needs_unindent):
+            break
+        lines = inner
+    return levels
+
+
+def line_offset(lines: Sequence[str], n: int) -> int:
+    """
+    Return the character offset of line n in "\n".join(lines).
+    """
+    return sum(map(len, islice(lines, n))) + n
+
+
+def text_span(
+    lines: Sequence[str],
+    line_range: tuple[int | None, int | None],
+    unindent: bool = False,
+    offset: Callable[[int], int] | None = None,
+    length: Callable[[str], int] = len,
+) -> tuple[int, int] | None:
+    """
+    Return the offsets (start, end) of the given range of lines in the text
+    that consists of the lines joined by newlines, with surrounding whitespace
+    removed, or None if there's nothing but whitespace.
+
+    If unindent is set, whitespace is removed after unindenting the lines,
+    i.e. the offsets skip the leading and trailing lines that are blank once
+    unindented, and the lines in text[start:end] need to be unindented and
+    stripped to get the text.
+
+    Offsets are character offsets, unless an offset function returning the
+    offset of the given line (or of the line after the last one) and a
+    length function for whitespace are passed, e.g. for byte offsets.
+    """
+    if offset is None:
+        offset = partial(line_offset, lines)
+
+    def strip(line: str) -> str:
+        return (unindent_line(line) if unindent else line).strip()
+
+    line_numbers = range(*slice(*line_range).indices(len(lines))[:2])
+    first = next((n for n in line_numbers if strip(lines[n])), None)
+    if first is None:
+        return None
+    last = next(n for n in reversed(line_numbers) if strip(lines[n]))
+
+    start = offset(first)
+    end = offset(last + 1) - 1
+    if not unindent:
+        first_line = lines[first]
+        start += length(
+            first_line[: len(first_line) - len(first_line.lstrip())]
+        )
+        last_line = lines[last]
+        end -= length(last_line[len(last_line.rstrip()) :])
+    return start, end
+
+
+def unwrap_spans(
+    lines: Sequence[str],
+    unwrap_result: tuple[
+        str,
+        tuple[int | None, int | None],
+        dict[str, str] | None,
+        tuple[int | None, int | None] | None,
+        tuple[int | None, int | None] | None,
+        bool,
+    ],
+    offset: Callable[[int], int] | None = None,
+    length: Callable[[str], int] = len,
+) -> dict[str, str | bool | tuple[int, int]]:
+    """
+    Turn the result of unwrap() into the dictionary that the public
+    unwrap_spans() returns, with the spans of the texts (see text_span).
+    """
+    typ, top_range, hdrs, main_range, bottom_range, needs_unindent = (
+        unwrap_result
+    )
+
+    result: dict[str, str | bool | tuple[int, int]] = {
+        "type": typ,
+    }
+
+    for key, line_range, unindent in (
+        ("text", main_range, needs_unindent),
+        ("text_top", top_range, False),
+        ("text_bottom", bottom_range, False),
+    ):
+        span = (
+            text_span(lines, line_range, unindent, offset, length)
+            if line_range
+            else None
+        )
+        if span:
+            result[key] = span
+
+    if needs_unindent and "text" in result:
+        result["unindent"] = True
+
+    if hdrs:
+        result.update(hdrs)
+
+    return result
+
+
+def decode_text(
+    text: str | bytes, charset: str | None = None
+) -> tuple[str, str]:
+    """
+    Return the given text as a string, decoding bytes with the given charset,
+    and the name of the charset that was used. Undecodable bytes are
+    replaced, and UTF-8 is used if no charset or an unknown one is given.
+    """
+    try:
+        encoding = codecs.lookup(charset or "utf-8").name
+    except LookupError:
+        encoding = "utf-8"
+    if isinstance(text, str):
+        return text, encoding
+    return text.decode(encoding, errors="replace"), encoding
+
+
+def _has_headers(text: str, header_re: re.Pattern) -> bool:
+    """
+    Return whether the header regex finds at least MIN_HEADER_LINES distinct
+    headers from HEADER_MAP in the given text.
+    """
+    found = set()
+    for match in header_re.finditer(text):
+        name = " ".join(match.group(1).lower().split())
+        if name in HEADER_MAP:
+            found.add(HEADER_MAP[name])
+            if len(found) >= MIN_HEADER_LINES:
+                return True
+    return False
+
+
+def _might_contain_pattern(text: str) -> bool:
+    return PATTERN_KEYWORD_RE is None or bool(PATTERN_KEYWORD_RE.search(text))
+
+
+def might_contain_quote(text: str) -> bool:
+    """
+    Cheaply check whether the given plain text could contain a reply/forward
+    pattern, quoted lines or headers, i.e. whether find_quote_position or
+    unwrap (with the default MIN_HEADER_LINES) could find anything, not
+    counting line limits. May return false positives, but never false
+    negatives.
+    """
+    return (
+        text.startswith(">")
+        or "\n>" in text
+        or _might_contain_pattern(text)
+        or _has_headers(text, HEADER_LINE_RE)
+    )
+
+
+def might_contain_quote_html(html_str: str) -> bool:
+    """
+    Like might_contain_quote(), but for HTML, without parsing the markup.
+    Besides looking at the text content, this looks for elements that indent
+    lines and for Outlook forward styles.
+    """
+    if INDENTATION_TAG_RE.search(html_str):
+        return True
+
+    if FORWARD_STYLE_KEYWORD_RE is None or FORWARD_STYLE_KEYWORD_RE.search(
+        html_str
+    ):
+        return True
+
+    # Keywords and headers can be split up by tags or contain entities.
+    text = HTML_TAG_RE.sub("", html_str)
+    if "&" in text:
+        text = unescape(text)
+
+    return _might_contain_pattern(text) or _has_headers(text, HTML_HEADER_RE)
+
+
+def max_html_lines(html_str: str, limit: int) -> int:
+    """
+    Return an upper bound of the number of lines that get_line_info() yields
+    for the given markup, without parsing it. Lines are only yielded for line
+    breaks and for lines containing text (when there are no forward styles),
+    so we count line break tags and runs of text between tags. The content of
+    raw text elements such as <style> may look like tags, so each of them is
+    counted as a line as well. Counting stops once the given limit is reached.
+    """
+    count = 0
+    for regex in (HTML_LINE_BREAK_RE, HTML_RAW_TEXT_TAG_RE, HTML_TEXT_RE):
+        for _ in regex.finditer(html_str):
+            count += 1
+            if count >= limit:
+                return count
+    return count
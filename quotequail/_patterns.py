@@ -108,12 +108,270 @@ COMPILED_PATTERN_MAP = {
     "forward": [re.compile(regex) for regex in FORWARD_PATTERNS],
 }
 
+# All reply and forward patterns as (type, regex), in order of precedence.
+PATTERNS: list[tuple[str, str]] = [
+    (typ, regex)
+    for typ, regexes in (
+        ("reply", REPLY_PATTERNS),
+        ("forward", FORWARD_PATTERNS),
+    )
+    for regex in regexes
+]
+
+# PATTERNS combined into a single alternation so that a line can be checked
+# against every pattern with one regex call. The alternative for PATTERNS[i]
+# is the named group "p<i>". Since alternatives are tried in order, the
+# reported group is the first pattern in PATTERNS that matches.
+COMBINED_PATTERN_RE = re.compile(
+    "|".join(f"(?P<p{i}>{regex})" for i, (_, regex) in enumerate(PATTERNS))
+)
+
 COMPILED_PATTERNS: list[re.Pattern] = [
     pattern
     for patterns in COMPILED_PATTERN_MAP.values()
     for pattern in patterns
 ]
 
+
+# Characters at the end of line where we join lines without adding a space.
+# For example, "John <\njohn@example>" becomes "John <john@example>", but
+# "John\nDoe" becomes "John Doe".
+STRIP_SPACE_CHARS = r"<([{\"'"
+
+# Punctuation that ordinary lines (dates, URLs, prose) commonly contain, which
+# makes a poor keyword, see required_keyword().
+COMMON_KEYWORD_CHARS = "/.,:;-_<>()[]{}\"'"
+
+
+def _find_group_end(regex: str, start: int) -> int:
+    """
+    Return the index of the parenthesis closing the group opened at the given
+    index of the regex.
+    """
+    depth = 0
+    i = start
+    while i < len(regex):
+        c = regex[i]
+        if c == "\\":
+            i += 1
+        elif c == "[":
+            i = regex.index("]", i + 1)
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ValueError(f"unbalanced group in {regex!r}")
+
+
+def _has_alternation(regex: str) -> bool:
+    """Return whether the regex has a "|" outside of any group or class."""
+    i = 0
+    while i < len(regex):
+        c = regex[i]
+        if c == "\\":
+            i += 1
+        elif c == "[":
+            i = regex.index("]", i + 1)
+        elif c == "(":
+            i = _find_group_end(regex, i)
+        elif c == "|":
+            return True
+        i += 1
+    return False
+
+
+def _split_keywords(run: str) -> list[str]:
+    """
+    Split a literal run into keywords that can't be split up when wrapped
+    lines are joined: at whitespace and after each of STRIP_SPACE_CHARS.
+    """
+    keywords = []
+    for word in run.split():
+        keyword = ""
+        for c in word:
+            keyword += c
+            if c in STRIP_SPACE_CHARS:
+                keywords.append(keyword)
+                keyword = ""
+        if keyword:
+            keywords.append(keyword)
+    return keywords
+
+
+def required_keyword(regex: str) -> str | None:
+    """
+    Return the rarest literal keyword that every string matched by the given
+    regex contains, or None if there is none. Only the regex syntax used in
+    this module is understood: literals and escapes, classes, groups, and
+    the quantifiers "*", "+", "?" and "{m,n}". Optional groups and groups
+    with alternatives are skipped.
+    """
+    if _has_alternation(regex):
+        return None
+
+    keywords: list[str] = []
+    run = ""
+    i = 0
+    while i < len(regex):
+        c = regex[i]
+        if c == "\\":
+            escaped = regex[i + 1]
+            i += 2
+            if escaped.isalnum():
+                # Character class such as \d or \s.
+                keywords += _split_keywords(run)
+                run = ""
+            else:
+                run += escaped
+            continue
+
+        if c in "*?{":
+            # The preceding item is optional.
+            keywords += _split_keywords(run[:-1])
+            run = ""
+            i = regex.index("}", i) + 1 if c == "{" else i + 1
+            continue
+
+        if c not in "[(.^$+)":
+            run += c
+            i += 1
+            continue
+
+        keywords += _split_keywords(run)
+        run = ""
+        if c == "[":
+            i = regex.index("]", i + 1) + 1
+        elif c == "(":
+            if regex.startswith("(?", i):
+                return None
+            end = _find_group_end(regex, i)
+            if _has_alternation(regex[i + 1 : end]) or (
+                end + 1 < len(regex) and regex[end + 1] in "*?{"
+            ):
+                # Skip the group, nothing within it is required.
+                i = end + 1
+                if regex.startswith("{", i):
+                    i = regex.index("}", i) + 1
+                elif regex.startswith(("*", "?"), i):
+                    i += 1
+            else:
+                i += 1
+        else:
+            i += 1
+
+    keywords += _split_keywords(run)
+    if not keywords:
+        return None
+    # Prefer the keyword with the most characters that aren't common
+    # punctuation, since it rules out the most lines, then the longest one.
+    return max(
+        keywords,
+        key=lambda keyword: (
+            sum(c not in COMMON_KEYWORD_CHARS for c in keyword),
+            len(keyword),
+        ),
+    )
+
+
+def _compile_keyword_re(regexes: list[str]) -> re.Pattern | None:
+    """
+    Compile a regex that finds any keyword required by the given regexes.
+    Returns None if any of the regexes has no required keyword, since we
+    can't rule out a match in that case.
+    """
+    keywords = set()
+    for regex in regexes:
+        keyword = required_keyword(regex)
+        if keyword is None:
+            return None
+        keywords.add(keyword)
+    # A keyword containing another keyword is redundant.
+    keywords = {
+        keyword
+        for keyword in keywords
+        if not any(other != keyword and other in keyword for other in keywords)
+    }
+    return re.compile(
+        "|".join(re.escape(keyword) for keyword in sorted(keywords))
+    )
+
+
+# Finds the literal keywords (e.g. "wrote:", "schrieb", "Forwarded") one of
+# which is contained in any line matching a reply or forward pattern, so
+# lines without a keyword can skip regex evaluation. None if the prefilter
+# can't be used because a pattern has no required keyword.
+PATTERN_KEYWORD_RE = _compile_keyword_re([regex for _, regex in PATTERNS])
+
+# Finds lines starting with a header name from HEADER_MAP as matched by
+# HEADER_RE, to cheaply rule out headers in a whole plain text message.
+HEADER_LINE_RE = re.compile(
+    r"^\*? *(" + "|".join(re.escape(name) for name in HEADER_MAP) + ") *:",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# Like HEADER_LINE_RE, but for the text content of an HTML message, where
+# lines don't start at line breaks and whitespace gets collapsed.
+HTML_HEADER_RE = re.compile(
+    r"("
+    + "|".join(re.escape(name).replace(r"\ ", r"\s+") for name in HEADER_MAP)
+    + r")\s*:",
+    re.IGNORECASE,
+)
+
+# Finds the keywords required by FORWARD_STYLES in raw markup, see
+# PATTERN_KEYWORD_RE.
+FORWARD_STYLE_KEYWORD_RE = _compile_keyword_re(
+    [style_re.pattern for style_re in FORWARD_STYLES]
+)
+
+# Finds elements that indent lines in HTML messages.
+INDENTATION_TAG_RE = re.compile(r"<blockquote\b", re.IGNORECASE)
+
+# Matches HTML tags, comments, doctypes and processing instructions, but not
+# unescaped address pseudo-tags such as <john@example.com>, which end up as
+# text in the lines (see HTML_PREFIXED_TAG_RE).
+HTML_TAG_RE = re.compile(r"<(?![^\s<>/]*@)[a-zA-Z/!?][^>]*>")
+
+# Finds text in markup that contains non-whitespace characters. Text right
+# after a tag, or at the start of the markup, is matched at most once. A "<"
+# that can't start a tag (e.g. "<3") is part of the text.
+HTML_TEXT_RE = re.compile(r"(?:^|>)(?:[^<>]|<(?![a-zA-Z/!?]))*?[^<>\s]")
+
+# Finds elements whose content is parsed as a single text node, even if it
+# looks like markup (e.g. a comment within <style>, as sent by Outlook).
+HTML_RAW_TEXT_TAG_RE = re.compile(
+    r"<(?:iframe|noembed|noframes|noscript|plaintext|script|style|textarea"
+    r"|title|xmp)\b",
+    re.IGNORECASE,
+)
+
+# Finds tags that produce line breaks in HTML messages.
+HTML_LINE_BREAK_RE = re.compile(r"</?br\b", re.IGNORECASE)
+
+# Finds start tags whose name contains ":" or "@" (e.g. Outlook's <o:p>, or
+# an unescaped <addr@domain>), as well as namespace declarations. May match
+# in places that don't end up being tags, but never misses one.
+HTML_PREFIXED_TAG_RE = re.compile(r"<[^\s<>/!?]*[:@]|\bxmlns\b")
+
+# Matches markup that lxml parses as a full HTML document (rather than a
+# fragment).
+HTML_DOCUMENT_RE = re.compile(r"\s*<(?:html|!doctype)", re.IGNORECASE)
+
+# Finds places where HTML markup can be split into chunks for incremental
+# parsing: a "<" starting a tag. Comments and the contents of raw text
+# elements are matched as a whole so they are never split.
+HTML_CHUNK_BOUNDARY_RE = re.compile(
+    r"<!--.*?(?:-->|\Z)"
+    r"|<(script|style|textarea|title|xmp|iframe|noembed|noframes|noscript)\b"
+    r".*?(?:</\1\s*>|\Z)"
+    r"|<plaintext\b.*"
+    r"|<(?=[a-zA-Z/])",
+    re.IGNORECASE | re.DOTALL,
+)
+
 MULTIPLE_WHITESPACE_RE = re.compile(r"\s+")
 
 # Amount to lines to join to check for potential wrapped patterns in plain text
@@ -125,8 +383,3 @@ MIN_HEADER_LINES = 2
 
 # minimum number of lines to recognize a quoted block
 MIN_QUOTED_LINES = 3
-
-# Characters at the end of line where we join lines without adding a space.
-# For example, "John <\njohn@example>" becomes "John <john@example>", but
-# "John\nDoe" becomes "John Doe".
-STRIP_SPACE_CHARS = r"<([{\"'"
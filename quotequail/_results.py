@@ -0,0 +1,152 @@
+from collections.abc import Iterator, Sequence
+from typing import TypeAlias
+
+from ._internal import LineView
+
+# Marks texts that weren't joined yet.
+_UNSET = object()
+
+LineRange: TypeAlias = tuple[int | None, int | None]
+
+
+class UnwrapResult:
+    """
+    Result of unwrap_lazy(): The type ("reply", "forward" or "quote") and the
+    headers of the wrapped message are available right away, while the texts
+    are only joined and stripped when they're first accessed.
+    """
+
+    __slots__ = (
+        "_bottom_range",
+        "_lines",
+        "_main_range",
+        "_needs_unindent",
+        "_text",
+        "_text_bottom",
+        "_text_top",
+        "_top_range",
+        "headers",
+        "type",
+    )
+
+    def __init__(
+        self,
+        lines: Sequence[str],
+        unwrap_result: tuple[
+            str,
+            LineRange,
+            dict[str, str] | None,
+            LineRange | None,
+            LineRange | None,
+            bool,
+        ],
+    ) -> None:
+        """
+        Takes the lines of the message and the tuple _internal.unwrap()
+        returned for them.
+        """
+        (
+            self.type,
+            self._top_range,
+            headers,
+            self._main_range,
+            self._bottom_range,
+            self._needs_unindent,
+        ) = unwrap_result
+        self.headers = headers or {}
+        self._lines = lines
+        self._text: object = _UNSET
+        self._text_top: object = _UNSET
+        self._text_bottom: object = _UNSET
+
+    def _join(
+        self,
+        line_range: LineRange | None,
+        level: int = 0,
+    ) -> str | None:
+        if not line_range:
+            return None
+        lines = LineView(self._lines, level=level)[slice(*line_range)]
+        return "\n".join(lines).strip() or None
+
+    @property
+    def text(self) -> str | None:
+        """
+        Unindented text of the wrapped message, or None if there's none.
+        """
+        if self._text is _UNSET:
+            self._text = self._join(
+                self._main_range, level=int(self._needs_unindent)
+            )
+        return self._text  # type: ignore[return-value]
+
+    @property
+    def text_top(self) -> str | None:
+        """
+        Text at the top of the message, or None if there's none.
+        """
+        if self._text_top is _UNSET:
+            self._text_top = self._join(self._top_range)
+        return self._text_top  # type: ignore[return-value]
+
+    @property
+    def text_bottom(self) -> str | None:
+        """
+        Text at the bottom of the message, or None if there's none.
+        """
+        if self._text_bottom is _UNSET:
+            self._text_bottom = self._join(self._bottom_range)
+        return self._text_bottom  # type: ignore[return-value]
+
+    def to_dict(self, *, text: bool = True) -> dict[str, str]:
+        """
+        Return the result as a dictionary, like unwrap() does. If text is
+        False, the text of the wrapped message is left out.
+        """
+        result = {
+            "type": self.type,
+        }
+        for key, value in (
+            ("text", self.text if text else None),
+            ("text_top", self.text_top),
+            ("text_bottom", self.text_bottom),
+        ):
+            if value:
+                result[key] = value
+        result.update(self.headers)
+        return result
+
+    def __repr__(self) -> str:
+        return f"<UnwrapResult type={self.type!r} headers={self.headers!r}>"
+
+
+class QuoteStreamResult:
+    """
+    Result of quote_stream().
+
+    Attributes:
+        text: The text that should be expanded by default, like the first
+            part returned by quote().
+        quoted: Whether the rest of the message is quoted text, i.e. whether
+            quote() would return a second part.
+        offset: The number of characters read from the lines before the rest
+            of the message.
+        rest: Iterator over the remaining lines as they were passed,
+            including the ones that weren't read yet.
+    """
+
+    __slots__ = ("offset", "quoted", "rest", "text")
+
+    def __init__(
+        self, text: str, quoted: bool, offset: int, rest: Iterator[str]
+    ) -> None:
+        self.text = text
+        self.quoted = quoted
+        self.offset = offset
+        self.rest = rest
+
+    def __repr__(self) -> str:
+        return (
+            f"<QuoteStreamResult quoted={self.quoted!r} "
+            f"offset={self.offset!r}>"
+        )
@@ -0,0 +1,367 @@
+from ._enums import Position
+from ._internal import (
+    HEADER_BITS,
+    WindowCache,
+    find_pattern_on_line,
+    parse_header_name,
+)
+from ._patterns import (
+    HEADER_MAP,
+    MAX_WRAP_LINES,
+    MIN_HEADER_LINES,
+    MIN_QUOTED_LINES,
+)
+
+
+class _QuotedScan:
+    """
+    Quoted lines counted from a candidate line, like QuoteRuns.quoted_count()
+    does, but resumable as more lines arrive and as the candidate moves on.
+    """
+
+    __slots__ = ("broken", "count", "pos")
+
+    def __init__(self, pos: int) -> None:
+        # Next line to look at
+        self.pos = pos
+        # Quoted lines between the candidate and pos
+        self.count = 0
+        # Whether the line at pos ends the run
+        self.broken = False
+
+
+class _HeaderScan:
+    """
+    Header block followed from a candidate header line, like
+    extract_headers() does, but resumable as more lines arrive and as the
+    candidate moves on to the following header lines of the block.
+    """
+
+    __slots__ = ("counts", "ended", "extend_lines", "header_name", "pos")
+
+    def __init__(self, pos: int) -> None:
+        self.pos = pos
+        # Number of header lines between the candidate and pos, per bit
+        self.counts: dict[int, int] = {}
+        self.ended = False
+        self.header_name: str | None = None
+        self.extend_lines = 0
+
+
+class QuoteScanner:
+    """
+    Push-based scanner that finds where quote() splits a plain text message
+    and where unwrap() finds the wrapped message, while the message is
+    still arriving.
+
+    Pass the text in chunks of any size to feed(), and call close() at the
+    end of the message. Each result is known as soon as no further text can
+    change it, and feed() returns True once both results are known, so that
+    reading the message can stop early. Only the lines that a pending
+    decision depends on are kept: The lines that a wrapped pattern spans, and
+    the quoted lines or header block that is being looked at.
+
+    Attributes:
+        quote_done: Whether quote_split is known.
+        quote_split: A tuple (line number, character offset) of the start of
+            the part that quote() doesn't expand, or None if quote() doesn't
+            split the message. A split after the last line (which only has
+            the end of the text after it) is at the end of the last line.
+        unwrap_done: Whether unwrap_start is known.
+        unwrap_start: The (start line number, end line number, type) tuple
+            that find_unwrap_start() returns for the message, or None.
+    """
+
+    def __init__(
+        self, *, limit: int | None = 1000, quote_intro_line: bool = False
+    ) -> None:
+        self.limit = limit
+        self.quote_intro_line = quote_intro_line
+        self.quote_done = False
+        self.quote_split: tuple[int, int] | None = None
+        self.unwrap_done = False
+        self.unwrap_start: tuple[int, int, str] | None = None
+        self.closed = False
+
+        # Complete lines that were received, starting at line number _base,
+        # which starts at character _base_offset.
+        self._lines: list[str] = []
+        self._base = 0
+        self._base_offset = 0
+        self._partial: list[str] = []
+        self._cache = WindowCache(self._lines)
+
+        # Next line to look at for each decision
+        self._quote_n = 0
+        self._unwrap_n = 0
+        self._quoted_scan: _QuotedScan | None = None
+        self._header_scan: _HeaderScan | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.quote_done and self.unwrap_done
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Pass the next chunk of the message. Returns True once all results are
+        known, in which case the rest of the message doesn't need to be fed.
+        """
+        if self.closed:
+            raise ValueError("feed() called after close()")
+        if self.done:
+            return True
+
+        parts = chunk.split("\n")
+        if len(parts) > 1:
+            self._partial.append(parts[0])
+            self._lines.append("".join(self._partial))
+            self._lines.extend(parts[1:-1])
+            self._partial = []
+        if parts[-1]:
+            self._partial.append(parts[-1])
+
+        self._scan()
+        return self.done
+
+    def close(self) -> None:
+        """
+        Mark the end of the message. All results are known afterwards.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if not self.done:
+            # Like str.split(), the last line may be empty.
+            self._lines.append("".join(self._partial))
+            self._partial = []
+            self._scan()
+        assert self.done
+
+    def _scan(self) -> None:
+        if not self.quote_done:
+            self._scan_quote()
+        if not self.unwrap_done:
+            self._scan_unwrap()
+        if self.done:
+            self._lines.clear()
+        else:
+            self._trim()
+
+    def _window_loaded(self, i: int) -> bool:
+        """
+        Whether all lines that a wrapped pattern on buffered line i can span
+        were received.
+        """
+        return self.closed or i + MAX_WRAP_LINES <= len(self._lines)
+
+    def _line_offset(self, n: int) -> int:
+        """
+        Return the character offset of the line n, which must be at most one
+        line after the last received line.
+        """
+        i = n - self._base
+        return (
+            self._base_offset + sum(len(line) for line in self._lines[:i]) + i
+        )
+
+    def _scan_quote(self) -> None:
+        """
+        Continue looking for the quote position like find_quote_position().
+        """
+        position = Position.Begin if self.quote_intro_line else Position.End
+        lines = self._lines
+        while True:
+            n = self._quote_n
+            i = n - self._base
+            if i >= len(lines):
+                if self.closed:
+                    self.quote_done = True
+                return
+            if not self._window_loaded(i):
+                return
+            result = find_pattern_on_line(
+                lines, i, MAX_WRAP_LINES, position, self._cache
+            )
+            found = None
+            if result:
+                found = result[0] + self._base
+            elif self.limit is not None and n >= self.limit - 1:
+                found = n
+            if found is not None:
+                split_n = found if self.quote_intro_line else found + 1
+                offset = self._line_offset(split_n)
+                if self.closed and split_n == self._base + len(lines):
+                    # There's no line after the last one, so the empty
+                    # quoted part starts at the end of the last line, like
+                    # quote_spans() returns it.
+                    split_n -= 1
+                    offset -= 1
+                self.quote_split = split_n, offset
+                self.quote_done = True
+                return
+            self._quote_n += 1
+
+    def _scan_unwrap(self) -> None:
+        """
+        Continue looking for the start of the wrapped message like
+        find_unwrap_start().
+        """
+        lines = self._lines
+        while True:
+            n = self._unwrap_n
+            i = n - self._base
+            if i >= len(lines):
+                if self.closed:
+                    self.unwrap_done = True
+                return
+            line = lines[i]
+            if line.strip():
+                if not self._window_loaded(i):
+                    return
+                result = find_pattern_on_line(
+                    lines, i, MAX_WRAP_LINES, Position.End, self._cache
+                )
+                if result:
+                    end, typ = result
+                    self.unwrap_start = n, end + self._base, typ
+                    self.unwrap_done = True
+                    return
+
+                for typ, is_start in (
+                    ("quoted", self._is_quoted_start),
+                    ("headers", self._is_headers_start),
+                ):
+                    found = is_start(n)
+                    if found is None:
+                        return
+                    if found:
+                        self.unwrap_start = n, n, typ
+                        self.unwrap_done = True
+                        return
+
+            self._advance_unwrap(line)
+
+    def _advance_unwrap(self, line: str) -> None:
+        """
+        Move on to the next line, keeping what the pending scans know about
+        the lines after it.
+        """
+        n = self._unwrap_n
+        self._unwrap_n += 1
+
+        scan = self._quoted_scan
+        if scan is not None:
+            if scan.pos <= n + 1:
+                self._quoted_scan = None
+            elif line.startswith(">"):
+                scan.count -= 1
+
+        header_scan = self._header_scan
+        if header_scan is not None:
+            if header_scan.pos <= n + 1:
+                self._header_scan = None
+            else:
+                name = parse_header_name(line)
+                mapped = HEADER_MAP.get(name) if name is not None else None
+                if mapped:
+                    bit = HEADER_BITS[mapped]
+                    header_scan.counts[bit] -= 1
+                    if not header_scan.counts[bit]:
+                        del header_scan.counts[bit]
+
+    def _is_quoted_start(self, n: int) -> bool | None:
+        """
+        Whether at least MIN_QUOTED_LINES quoted lines start at line n,
+        ignoring blank lines, or None if that isn't known yet.
+        """
+        lines = self._lines
+        if not lines[n - self._base].startswith(">"):
+            return False
+
+        scan = self._quoted_scan
+        if scan is None:
+            scan = self._quoted_scan = _QuotedScan(n)
+        while (
+            scan.count < MIN_QUOTED_LINES
+            and not scan.broken
+            and scan.pos - self._base < len(lines)
+        ):
+            line = lines[scan.pos - self._base]
+            if line.startswith(">"):
+                scan.count += 1
+            elif line.strip():
+                scan.broken = True
+                break
+            scan.pos += 1
+
+        if scan.count >= MIN_QUOTED_LINES:
+            return True
+        if scan.broken or self.closed:
+            return False
+        return None
+
+    def _is_headers_start(self, n: int) -> bool | None:
+        """
+        Whether line n starts a header block with at least MIN_HEADER_LINES
+        headers, or None if that isn't known yet.
+        """
+        lines = self._lines
+        if parse_header_name(lines[n - self._base]) is None:
+            return False
+
+        scan = self._header_scan
+        if scan is None:
+            scan = self._header_scan = _HeaderScan(n)
+        while (
+            len(scan.counts) < MIN_HEADER_LINES
+            and not scan.ended
+            and scan.pos - self._base < len(lines)
+        ):
+            line = lines[scan.pos - self._base]
+            if not line.strip():
+                scan.header_name = None
+            else:
+                name = parse_header_name(line)
+                if name is not None:
+                    scan.header_name = name
+                    scan.extend_lines = 0
+                    mapped = HEADER_MAP.get(name)
+                    if mapped:
+                        bit = HEADER_BITS[mapped]
+                        scan.counts[bit] = scan.counts.get(bit, 0) + 1
+                else:
+                    scan.extend_lines += 1
+                    if (
+                        scan.extend_lines >= MAX_WRAP_LINES
+                        or scan.header_name not in HEADER_MAP
+                    ):
+                        scan.ended = True
+                        break
+            scan.pos += 1
+
+        if len(scan.counts) >= MIN_HEADER_LINES:
+            return True
+        if scan.ended or self.closed:
+            return False
+        return None
+
+    def _trim(self) -> None:
+        """
+        Drop the lines that no pending decision depends on anymore, once
+        they make up half of the buffer.
+        """
+        keep = min(
+            n
+            for n, done in (
+                (self._quote_n, self.quote_done),
+                (self._unwrap_n, self.unwrap_done),
+            )
+            if not done
+        )
+        drop = keep - self._base
+        if drop < max(len(self._lines) // 2, 1):
+            return
+        self._base_offset = self._line_offset(keep)
+        del self._lines[:drop]
+        self._base = keep
+        self._cache = WindowCache(self._lines)
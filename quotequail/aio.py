@@ -0,0 +1,180 @@
+"""
+asyncio versions of the quotequail functions, which run them on a thread
+pool so that long messages don't block the event loop.
+"""
+
+import asyncio
+import os
+import threading
+from collections import deque
+from collections.abc import (
+    AsyncGenerator,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Iterable,
+)
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, TypeVar
+
+import quotequail
+
+from . import _batch
+
+__all__ = [
+    "get_executor",
+    "pipeline",
+    "quote",
+    "quote_html",
+    "unwrap",
+    "unwrap_html",
+]
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+    """
+    Return the thread pool shared by the functions of this module, creating
+    it on first use. It has one worker per CPU, since the work is CPU-bound
+    and only lxml's parsing runs without the GIL.
+    """
+    global _executor  # noqa: PLW0603
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                thread_name_prefix="quotequail",
+                initializer=_batch._warm_up_thread,
+            )
+        return _executor
+
+
+async def _run(
+    func: Callable[..., R],
+    message: Any,
+    executor: Executor | None,
+    kwargs: dict[str, Any],
+) -> R:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor or get_executor(), partial(func, message, **kwargs)
+    )
+
+
+async def quote(
+    text: str | bytes, *, executor: Executor | None = None, **kwargs: Any
+) -> list[tuple[bool, str]]:
+    """
+    Like quotequail.quote(), but runs on the given executor (the shared one
+    by default). Keyword arguments are passed to quotequail.quote().
+    """
+    return await _run(quotequail.quote, text, executor, kwargs)
+
+
+async def quote_html(
+    html: str | bytes, *, executor: Executor | None = None, **kwargs: Any
+) -> list[tuple[bool, str]]:
+    """
+    Like quotequail.quote_html(), but runs on the given executor (the shared
+    one by default).
+    """
+    return await _run(quotequail.quote_html, html, executor, kwargs)
+
+
+async def unwrap(
+    text: str | bytes, *, executor: Executor | None = None, **kwargs: Any
+) -> dict[str, str] | None:
+    """
+    Like quotequail.unwrap(), but runs on the given executor (the shared one
+    by default).
+    """
+    return await _run(quotequail.unwrap, text, executor, kwargs)
+
+
+async def unwrap_html(
+    html: str | bytes, *, executor: Executor | None = None, **kwargs: Any
+) -> dict[str, str] | None:
+    """
+    Like quotequail.unwrap_html(), but runs on the given executor (the shared
+    one by default).
+    """
+    return await _run(quotequail.unwrap_html, html, executor, kwargs)
+
+
+async def _aiter(
+    messages: AsyncIterable[T] | Iterable[T],
+) -> AsyncGenerator[T, None]:
+    if isinstance(messages, AsyncIterable):
+        async for message in messages:
+            yield message
+    else:
+        for message in messages:
+            yield message
+
+
+async def pipeline(
+    func: Callable[..., R],
+    messages: AsyncIterable[T] | Iterable[T],
+    *,
+    max_in_flight: int = 8,
+    executor: Executor | None = None,
+    **kwargs: Any,
+) -> AsyncIterator[tuple[T, R | Exception]]:
+    """
+    Run func (e.g. quotequail.unwrap_html) on each message of an (async)
+    iterable on the given executor (the shared one by default), and yield
+    (message, result) tuples in the order of the messages. If func raises an
+    exception for a message, the exception is yielded in place of its
+    result.
+
+    At most max_in_flight messages are processed or waiting to be consumed
+    at a time. The next message is only read once a result was consumed, so
+    a slow consumer slows down reading the messages.
+
+    Example:
+        async for message, result in pipeline(quotequail.unwrap, messages):
+            ...
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+
+    loop = asyncio.get_running_loop()
+    pending: deque[tuple[T, asyncio.Future[R]]] = deque()
+    source = _aiter(messages)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < max_in_flight:
+                try:
+                    message = await source.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                future = loop.run_in_executor(
+                    executor or get_executor(),
+                    partial(func, message, **kwargs),
+                )
+                pending.append((message, future))
+
+            if not pending:
+                return
+
+            message, future = pending.popleft()
+            result: R | Exception
+            try:
+                result = await future
+            except Exception as e:
+                result = e
+            yield message, result
+    finally:
+        # Don't start the messages that weren't consumed, e.g. when the
+        # consumer stops early.
+        for _, future in pending:
+            future.cancel()
+        await source.aclose()
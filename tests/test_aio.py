@@ -0,0 +1,72 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import quotequail
+from quotequail import aio
+
+TEXT = "Hello world.\n\nOn Monday, John <john@example.com> wrote:\n\n> Hi"
+HTML = (
+    "<p>Hello</p><p>On Monday, John &lt;j@example.com&gt; wrote:</p>"
+    "<blockquote>Hi</blockquote>"
+)
+
+
+def test_functions():
+    async def run():
+        assert await aio.quote(TEXT, limit=2) == quotequail.quote(
+            TEXT, limit=2
+        )
+        assert await aio.unwrap(TEXT) == quotequail.unwrap(TEXT)
+        assert await aio.quote_html(HTML) == quotequail.quote_html(HTML)
+        with ThreadPoolExecutor(1) as executor:
+            assert await aio.unwrap_html(
+                HTML, executor=executor
+            ) == quotequail.unwrap_html(HTML)
+
+    asyncio.run(run())
+
+
+def test_pipeline():
+    read = []
+
+    async def messages():
+        for n in range(20):
+            read.append(n)
+            yield TEXT if n % 2 else None
+
+    async def run():
+        results = []
+        async for message, result in aio.pipeline(
+            quotequail.unwrap, messages(), max_in_flight=3
+        ):
+            # Reading is held back until results are consumed.
+            assert len(read) <= len(results) + 3
+            results.append((message, result))
+        return results
+
+    results = asyncio.run(run())
+    assert [message for message, _ in results] == [
+        TEXT if n % 2 else None for n in range(20)
+    ]
+    for n, (_, result) in enumerate(results):
+        if n % 2:
+            assert result == quotequail.unwrap(TEXT)
+        else:
+            assert isinstance(result, AttributeError)
+
+
+def test_pipeline_stops_early():
+    async def run():
+        results = aio.pipeline(quotequail.quote, [TEXT] * 100, max_in_flight=4)
+        async for _, result in results:
+            assert result == quotequail.quote(TEXT)
+            break
+        await results.aclose()
+
+        results = aio.pipeline(quotequail.quote, [], max_in_flight=0)
+        with pytest.raises(ValueError, match="max_in_flight"):
+            await results.__anext__()
+
+    asyncio.run(run())
@@ -0,0 +1,109 @@
+import subprocess
+import sys
+import textwrap
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from quotequail import (
+    quote,
+    quote_html,
+    quote_html_many,
+    quote_many,
+    unwrap,
+    unwrap_html,
+    unwrap_html_many,
+    unwrap_many,
+)
+
+TEXTS = [
+    "Hello world.\n\nOn Monday, John <john@example.com> wrote:\n\n> Hi",
+    "Hello",
+    "Hi\n\nBegin forwarded message:\n\nFrom: a@b.c\nSubject: Hi\n\nText",
+    "Lorem\nIpsum\nDolor",
+]
+
+HTMLS = [
+    "<p>Hello</p><p>On Monday, John &lt;j@example.com&gt; wrote:</p>"
+    "<blockquote>Hi</blockquote>",
+    "<p>Hello</p>",
+]
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 3])
+def test_quote_many(chunk_size):
+    expected = [quote(text, limit=2) for text in TEXTS]
+    assert quote_many(TEXTS, chunk_size=chunk_size, limit=2) == expected
+    with ThreadPoolExecutor(2) as executor:
+        assert (
+            quote_many(
+                TEXTS, executor=executor, chunk_size=chunk_size, limit=2
+            )
+            == expected
+        )
+
+
+def test_unwrap_many_process_pool(monkeypatch):
+    expected = [unwrap(text) for text in TEXTS]
+    with ProcessPoolExecutor(2) as executor:
+        assert unwrap_many(TEXTS, executor=executor, chunk_size=1) == expected
+
+    # A pool is created when the batch spans chunks and there are CPUs to
+    # spread them over.
+    monkeypatch.setattr("os.cpu_count", lambda: 2)
+    assert unwrap_many(TEXTS * 10) == expected * 10
+
+
+def test_html_many(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 2)
+    assert (
+        quote_html_many(HTMLS * 10)
+        == [quote_html(html) for html in HTMLS] * 10
+    )
+    assert unwrap_html_many(HTMLS * 10, chunk_size=3) == (
+        [unwrap_html(html) for html in HTMLS] * 10
+    )
+
+
+def test_errors():
+    results = unwrap_many(["Hello", None, TEXTS[2]], chunk_size=2)
+    assert results[0] is None
+    assert isinstance(results[1], AttributeError)
+    assert results[2] == unwrap(TEXTS[2])
+
+    with ProcessPoolExecutor(1) as executor:
+        # Lambdas can't be pickled, so whole chunks fail.
+        results = quote_many(
+            ["Hello", "World", "!"],
+            executor=executor,
+            chunk_size=2,
+            limit=lambda: 1,
+        )
+    assert all(isinstance(result, Exception) for result in results)
+    assert results[1] is results[0]
+    assert results[2] is not results[0]
+
+    with pytest.raises(ValueError, match="chunk_size"):
+        quote_many(TEXTS, chunk_size=0)
+
+
+def test_without_lxml():
+    # lxml is only needed for HTML, so the package and the text functions
+    # must work without it.
+    code = textwrap.dedent(
+        f"""
+        import sys
+        from concurrent.futures import ThreadPoolExecutor
+
+        sys.modules["lxml"] = None
+
+        import quotequail
+        import quotequail.aio
+
+        with ThreadPoolExecutor(2) as executor:
+            assert quotequail.quote_many(
+                {TEXTS!r}, executor=executor, chunk_size=1
+            ) == [quotequail.quote(text) for text in {TEXTS!r}]
+        """
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)  # noqa: S603
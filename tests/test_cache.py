@@ -0,0 +1,144 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import quotequail
+from quotequail import MemoryBackend, ResultCache, SQLiteBackend
+
+TEXT = "Hello world.\n\nOn Monday, John <john@example.com> wrote:\n\n> Hi"
+FORWARD = (
+    "Hi\n\nBegin forwarded message:\n\n> From: a@b.c\n> Subject: Hi\n>\n"
+    ">  Text"
+)
+HTML = (
+    "<p>Hello</p><p>On Monday, John &lt;j@example.com&gt; wrote:</p>"
+    "<blockquote>Hi</blockquote>"
+)
+
+
+def test_result_cache():
+    cache = ResultCache()
+    for _ in range(2):
+        assert cache.quote(TEXT) == quotequail.quote(TEXT)
+        assert cache.quote(TEXT, quote_intro_line=True) == quotequail.quote(
+            TEXT, quote_intro_line=True
+        )
+        assert cache.quote(TEXT.encode()) == quotequail.quote(TEXT)
+        assert cache.unwrap(FORWARD) == quotequail.unwrap(FORWARD)
+        assert cache.unwrap("Hello") is None
+        assert cache.quote_html(HTML) == quotequail.quote_html(HTML)
+        assert cache.unwrap_html(HTML) == quotequail.unwrap_html(HTML)
+    assert cache.misses == 7
+    assert cache.hits == 7
+
+    # Results can be modified without affecting the cache.
+    cache.unwrap_html(HTML)["type"] = "forward"
+    assert cache.unwrap_html(HTML) == quotequail.unwrap_html(HTML)
+
+
+def test_result_cache_parent():
+    parent = "Hi,\n\nAre we still on for Friday?\n\nJohn"
+    reply = (
+        "Yes!\n\n---------- Forwarded message ----------\nSee above.\n\n"
+        "On Monday, John <john@example.com> wrote:\n\n"
+        "> Hi,\n>\n> Are we still on for Friday?\n>\n> John\n"
+    )
+    cache = ResultCache()
+    for _ in range(2):
+        assert cache.unwrap(reply, parent=parent) == quotequail.unwrap(
+            reply, parent=parent
+        )
+        assert cache.unwrap(reply)["type"] == "forward"
+        assert cache.quote(reply, parent=parent) == quotequail.quote(
+            reply, parent=parent
+        )
+        assert cache.quote(
+            reply.encode("latin-1"),
+            parent=parent.encode("latin-1"),
+            charset="latin-1",
+        ) == quotequail.quote(reply, parent=parent)
+    assert cache.unwrap(reply, parent=parent)["type"] == "reply"
+    assert cache.misses == 4
+    assert cache.hits == 5
+
+
+def test_result_cache_uncached():
+    cache = ResultCache()
+    parser = quotequail._html.parse_html_lxml
+    for _ in range(2):
+        assert cache.quote_html(HTML, parser=parser) == quotequail.quote_html(
+            HTML
+        )
+    assert cache.hits == cache.misses == 0
+
+
+def test_result_cache_threads():
+    cache = ResultCache()
+    texts = [f"{TEXT}\n> {n % 10}" for n in range(1000)]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(cache.quote, texts))
+    # Concurrent misses for the same text may each be counted as a miss.
+    assert cache.hits + cache.misses == len(texts)
+    assert cache.misses >= 10
+
+
+def test_memory_backend():
+    backend = MemoryBackend(max_entries=2, max_bytes=100)
+    backend.set("a", "A", 10)
+    backend.set("b", "B", 10)
+    assert backend.get("a") == "A"
+    backend.set("c", "C", 10)
+    # The least recently used entry is evicted.
+    assert backend.get("b") is None
+    assert len(backend) == 2
+
+    backend.set("d", "D", 85)
+    assert backend.get("a") is None
+    assert backend.get("c") == "C"
+    assert backend.get("d") == "D"
+    assert backend.size == 95
+
+    # Entries above the limit aren't stored.
+    backend.set("e", "E", 101)
+    assert backend.get("e") is None
+    assert backend.get("d") == "D"
+
+
+class DictBackend:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, entry, size):
+        self.entries[key] = entry
+
+
+def test_custom_backend():
+    backend = DictBackend()
+    cache = ResultCache(backend)
+    assert cache.quote(TEXT) == quotequail.quote(TEXT)
+    # Only offsets are stored for plain text messages.
+    assert list(backend.entries.values()) == [[[True, 0, 55], [False, 56, 61]]]
+    assert ResultCache(backend).quote(TEXT) == quotequail.quote(TEXT)
+
+
+def test_sqlite_backend(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = ResultCache(SQLiteBackend(path))
+    assert cache.quote(TEXT) == quotequail.quote(TEXT)
+    assert cache.unwrap("Hello") is None
+    long_html = HTML * 100
+    assert cache.unwrap_html(long_html) == quotequail.unwrap_html(long_html)
+    assert cache.misses == 3
+
+    # Another process would share the entries through the file.
+    cache = ResultCache(SQLiteBackend(path))
+    with ThreadPoolExecutor(2) as executor:
+        assert list(executor.map(cache.quote, [TEXT] * 4)) == (
+            [quotequail.quote(TEXT)] * 4
+        )
+    assert cache.unwrap("Hello") is None
+    assert cache.unwrap_html(long_html) == quotequail.unwrap_html(long_html)
+    assert cache.misses == 0
+    assert cache.hits == 6
+    cache.backend.close()
@@ -1,7 +1,16 @@
+import threading
+
+import lxml.html
+import pytest
+
 from quotequail._html import (
     Position,
+    clone_tree,
     get_html_tree,
+    get_line_info,
+    parse_html_lxml,
     render_html_tree,
+    slice_trees,
     tree_line_generator,
     trim_tree_after,
     trim_tree_before,
@@ -112,3 +121,118 @@ def test_get_html_tree_flattens_at_pseudo_tag_with_attributes():
     html = '<div>x<addr@domain foo="bar">y</addr@domain>z</div>'
     rendered = render_html_tree(get_html_tree(html))
     assert rendered == '<div>x&lt;addr@domain foo="bar"&gt;yz</div>'
+
+
+def test_get_html_tree_prefixed_tags():
+    html = '<div>A<o:p>B</o:p><span class="x:y">C</span></div>'
+    tree = get_html_tree(html)
+    assert [el.get("__tag_name") for el in tree.iter("span")] == ["o:p", None]
+    assert render_html_tree(tree) == html
+
+    # Without prefixed tags in the markup, no element is touched.
+    html = '<div><a href="mailto:a@example.com">A</a></div>'
+    tree = get_html_tree(html)
+    assert tree.xpath("//*[@__tag_name]") == []
+    assert render_html_tree(tree) == html
+
+
+def test_clone_tree():
+    tree = get_html_tree("<div>A<span>B</span>C<br>D</div>")
+    span = tree.find("div/span")
+    br = tree.find("div/br")
+    new_tree, new_refs = clone_tree(
+        tree, [(span, Position.Begin), None, (br, Position.End)]
+    )
+    assert new_tree is not tree
+    assert new_refs[0] == (new_tree.find("div/span"), Position.Begin)
+    assert new_refs[1] is None
+    assert new_refs[2] == (new_tree.find("div/br"), Position.End)
+    assert render_html_tree(new_tree) == render_html_tree(tree)
+    assert "__clone" not in render_html_tree(tree)
+
+
+def test_slice_trees():
+    html = "<div>A<br>B<br>C<br>D</div>"
+    tree = get_html_tree(html)
+    start_refs, end_refs, lines = get_line_info(tree)
+    assert list(lines) == ["A", "B", "C", "D"]
+    trees = slice_trees(
+        tree, start_refs, end_refs, [(0, 1), (3, None), (1, 3)]
+    )
+    assert [render_html_tree(t) for t in trees] == [
+        "<div>A</div>",
+        "<div>D</div>",
+        "<div>B<br>C</div>",
+    ]
+    # The last slice is taken from the tree itself.
+    assert trees[2] is tree
+
+
+def test_tree_line_generator_deep_nesting():
+    # Deeper than the recursion limit. libxml2 caps the depth when parsing,
+    # so build the tree directly.
+    depth = 5000
+    tree = get_html_tree("<div>top</div>")
+    parent = tree
+    for _ in range(depth):
+        parent = lxml.html.etree.SubElement(parent, "blockquote")
+        parent.text = "x"
+    data = list(tree_line_generator(tree))
+    assert len(data) == depth + 1
+    assert data[0][2:] == (0, "top")
+    assert data[-1][2:] == (depth, "x")
+
+
+@pytest.mark.parametrize("parser", ["lxml", "html5lib"])
+def test_get_html_tree_parsers(parser):
+    if parser == "html5lib":
+        pytest.importorskip("html5lib")
+
+    for html, expected in [
+        ("", ""),
+        ("Hello", "Hello"),
+        ("<p>A</p>", "<p>A</p>"),
+        ("<p>A</p><p>B</p>", "<p>A</p><p>B</p>"),
+        (
+            "<div>A<o:p>B</o:p><addr@domain>C</addr@domain></div>",
+            "<div>A<o:p>B</o:p>&lt;addr@domain&gt;C</div>",
+        ),
+        (
+            "<!DOCTYPE html><html><head></head><body>A</body></html>",
+            "<html><head></head><body>A</body></html>",
+        ),
+    ]:
+        tree = get_html_tree(html, parser)
+        assert render_html_tree(tree) == expected
+
+
+def test_get_html_tree_custom_parser():
+    calls = []
+
+    def parse(html):
+        calls.append(html)
+        return lxml.html.fromstring(html)
+
+    tree = get_html_tree("<p>A</p>", parse)
+    assert render_html_tree(tree) == "<p>A</p>"
+    assert calls == ["<p>A</p>", "<div><p>A</p></div>"]
+
+
+def test_get_html_tree_unknown_parser():
+    with pytest.raises(ValueError, match='"lxml", "html5lib"'):
+        get_html_tree("<p>A</p>", "bs4")
+
+
+def test_parse_html_lxml_reuses_parser():
+    def get_parser():
+        return parse_html_lxml("<p>A</p>").getroottree().parser
+
+    parser = get_parser()
+    assert get_parser() is parser
+
+    # Each thread uses its own parser.
+    parsers = []
+    thread = threading.Thread(target=lambda: parsers.append(get_parser()))
+    thread.start()
+    thread.join()
+    assert parsers[0] is not parser
@@ -1,6 +1,26 @@
 import pytest
 
-from quotequail._internal import extract_headers, parse_reply
+from quotequail._enums import Position
+from quotequail._html import get_html_tree, get_line_info
+from quotequail._internal import (
+    HeaderRuns,
+    LineView,
+    QuoteRuns,
+    WindowCache,
+    extract_headers,
+    find_pattern_on_line,
+    join_wrapped_lines,
+    match_pattern,
+    max_html_lines,
+    parse_reply,
+    unindent_lines,
+)
+from quotequail._patterns import (
+    PATTERN_KEYWORD_RE,
+    PATTERNS,
+    REPLY_PATTERNS,
+    required_keyword,
+)
 
 
 @pytest.mark.parametrize(
@@ -89,6 +109,7 @@ from quotequail._internal import extract_headers, parse_reply
 )
 def test_parse_reply(line, expected):
     assert parse_reply(line) == expected
+    assert PATTERN_KEYWORD_RE.search(line)
 
 
 def test_extract_headers():
@@ -133,3 +154,159 @@ def test_extract_headers():
         },
         1,
     )
+
+
+@pytest.mark.parametrize("max_wrap_lines", [1, 2, 3])
+def test_header_runs(max_wrap_lines):
+    lines = [
+        "Hello",
+        "",
+        "Key: value",
+        "From: a",
+        "wrapped",
+        "",
+        "To: b",
+        "Other: c",
+        "",
+        "text",
+        "Subject: s",
+        "cc: d",
+        "wrapped",
+        "twice",
+        "From: e",
+    ]
+    runs = HeaderRuns(lines, max_wrap_lines)
+    # Query out of order to exercise the memoized links.
+    for n in [*range(len(lines), -1, -3), *range(len(lines) + 1)]:
+        hdrs, length = extract_headers(lines[n:], max_wrap_lines)
+        assert runs.header_count(n) == len(hdrs)
+        assert runs.extract(n) == (hdrs, length)
+
+
+def test_quote_runs():
+    lines = [
+        "Hello",
+        "> a",
+        ">> b",
+        "",
+        "> c",
+        "d",
+        "",
+        ">e",
+        "",
+        "",
+    ]
+    runs = QuoteRuns(lines)
+    assert [runs.depth(n) for n in range(len(lines))] == [
+        0, 1, 2, 0, 1, 0, 0, 1, 0, 0,
+    ]  # fmt: skip
+    # Query out of order to exercise the memoized runs.
+    for n in [*range(len(lines), -1, -3), *range(len(lines) + 1)]:
+        assert runs.run_length(n) == len(unindent_lines(lines[n:]))
+    assert [runs.quoted_count(n, 2) for n in range(len(lines) + 1)] == [
+        0, 2, 2, 1, 1, 0, 1, 1, 0, 0, 0,
+    ]  # fmt: skip
+    assert [runs.quoted_count(n) for n in range(len(lines) + 1)] == [
+        0, 3, 2, 1, 1, 0, 1, 1, 0, 0, 0,
+    ]  # fmt: skip
+
+
+def test_line_view():
+    lines = ["a", "> b", ">> c", "> > d", "e"]
+    view = LineView(lines, 1, 4, level=1)
+    assert len(view) == 3
+    assert list(view) == ["b", "> c", "> d"]
+    assert view[0] == "b"
+    assert view[-1] == "> d"
+    with pytest.raises(IndexError):
+        view[3]
+
+    # Views of views refer to the original lines.
+    nested = LineView(view, 1, level=1)
+    assert nested.lines is lines
+    assert (nested.start, nested.stop, nested.level) == (2, 4, 2)
+    assert list(nested) == ["c", "d"]
+    assert list(view[1:]) == ["> c", "> d"]
+    assert list(view[-1:]) == ["> d"]
+    assert list(view[2:1]) == []
+    assert list(LineView(lines)[3:]) == ["> > d", "e"]
+
+
+def test_match_pattern():
+    assert match_pattern("Hello world") is None
+    idx, typ = match_pattern("On Monday, John Doe wrote:")
+    assert typ == "reply"
+    assert PATTERNS[idx] == ("reply", "^On (.*) wrote:$")
+    idx, typ = match_pattern("---------- Forwarded message ----------")
+    assert typ == "forward"
+    assert PATTERNS[idx] == ("forward", "^---+ ?Forwarded [mM]essage ?---+$")
+
+
+@pytest.mark.parametrize(
+    ("lines", "position", "expected"),
+    [
+        (["Hello", "world"], Position.End, None),
+        (["On Monday, John Doe wrote:", "> hi"], Position.End, (0, "reply")),
+        (["On Monday, John Doe", "wrote:"], Position.Begin, (0, "reply")),
+        (["On Monday, John Doe", "wrote:"], Position.End, (1, "reply")),
+        ([">", "Begin forwarded message:"], Position.End, None),
+        (["> Begin forwarded message:"], Position.End, (0, "forward")),
+    ],
+)
+def test_find_pattern_on_line(lines, position, expected):
+    assert find_pattern_on_line(lines, 0, 2, position) == expected
+
+
+def test_window_cache():
+    lines = ["> On Monday, John <", "john@example.com> wrote:", "", ">  "]
+    cache = WindowCache(lines)
+    for n in range(len(lines)):
+        for m in range(3):
+            assert cache.joined(n, m) == join_wrapped_lines(
+                lines[n : n + 1 + m]
+            )
+    assert cache.candidate(0, 1) == "On Monday, John <john@example.com> wrote:"
+    assert cache.candidate(2, 0) is None
+    assert cache.candidate(3, 0) is None
+    assert cache.candidate(0, 1) is cache.candidate(0, 1)
+
+
+@pytest.mark.parametrize(
+    ("regex", "expected"),
+    [
+        ("^On (.*) wrote:$", "wrote:"),
+        (r"^(.*) написал\(а\):$", "написал("),
+        ("^---+ ?Forwarded [mM]essage ?---+$", "Forwarded"),
+        ("^---+$", "---"),
+        ("ab(cd)?e", "ab"),
+        ("a(b|c)dd", "dd"),
+        (r"\d+ items", "items"),
+        ("yes|no", None),
+        (".*", None),
+        # Common punctuation is only picked if there's nothing else.
+        ("/ x", "x"),
+        (REPLY_PATTERNS[-1], "@"),  # gmail reply
+    ],
+)
+def test_required_keyword(regex, expected):
+    assert required_keyword(regex) == expected
+
+
+@pytest.mark.parametrize(
+    "html",
+    [
+        "",
+        "text",
+        "<p>One</p><p>Two</p><p>Three</p>",
+        "<div>A<br><br>B<span>C</span>D</div>",
+        "<!-- x --><div> </div>\n<p>x &gt; y</p>",
+        "<table><tr><td>a</td><td>b</td></tr><tr><td>c</td></tr></table>",
+        # Raw text that looks like markup.
+        "<style><!-- p {} --></style><p>a</p><p>b</p><p>c</p>",
+        "<script>if (a<b) {}</script><title><T></title><p>a</p>",
+        "<p>a</p><3 b<p>c</p>",
+    ],
+)
+def test_max_html_lines(html):
+    lines = get_line_info(get_html_tree(html))[2]
+    assert len(lines) <= max_html_lines(html, 1000)
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from quotequail import (
+    might_contain_quote,
+    might_contain_quote_html,
+    quote_html,
+    unwrap_html,
+)
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("", False),
+        ("Hello world\n\nThanks, John", False),
+        ("Let's meet at 10:00.\nTo do: nothing", False),
+        ("Hello\n\nOn Monday, John Doe wrote:\nhi", True),
+        ("Hello\n\nOn Monday, John Doe\nwrote:\nhi", True),
+        ("> quoted", True),
+        ("Hello\n> quoted", True),
+        ("Hello\n\nFrom: John\nTo: Jane\n\nHi", True),
+        ("Hello\n\n*From:* John\n*Sent:* Monday\n\nHi", True),
+        ("Hello\n\nFrom: John\nFrom: Jane\n\nHi", False),
+        ("---------- Forwarded message ----------", True),
+        ("Иван написал(а):", True),
+    ],
+)
+def test_might_contain_quote(text, expected):
+    assert might_contain_quote(text) == expected
+
+
+@pytest.mark.parametrize(
+    ("html", "expected"),
+    [
+        ("", False),
+        ("<p>One</p><p>Two</p>", False),
+        ('<a href="mailto:a@b.c">Mail to: me</a>', False),
+        ("<div>Hi<blockquote>quoted</blockquote></div>", True),
+        ("<div>On Monday, John <b>wrote</b>:</div>", True),
+        ("<div>Forw<span>arded</span> message:</div>", True),
+        ("<div>Hi</div><div>From: a</div><div>Subject: b</div>", True),
+        ("<div>Antwort&nbsp;an: a</div><div>Betreff:\nb</div>", True),
+        ("<div>Le lundi, John a &eacute;crit&nbsp;:</div>", True),
+        # Unescaped address pseudo-tags are text.
+        ("<div>2020/1/2 John <john@x.com></div>", True),
+        (
+            '<div style="border:none;border-top:solid #E1E1E1 1.0pt;'
+            'padding:3.0pt 0in 0in 0in"></div>',
+            True,
+        ),
+    ],
+)
+def test_might_contain_quote_html(html, expected):
+    assert might_contain_quote_html(html) == expected
+
+
+@pytest.mark.parametrize(
+    "file",
+    sorted(os.listdir(os.path.join(os.path.dirname(__file__), "files"))),
+)
+def test_no_false_negatives_html(read_file, file):
+    html = read_file(file)
+    if unwrap_html(html) or len(quote_html(html)) > 1:
+        assert might_contain_quote_html(html)
+
+
+def test_unescaped_address_reply_html():
+    html = (
+        "<div>Thanks</div><div>2020/1/2 John <john@x.com></div>"
+        "<div>old text</div>"
+    )
+    assert unwrap_html(html) == {
+        "type": "reply",
+        "date": "2020/1/2",
+        "from": "John <john@x.com>",
+        "html_top": "<div>Thanks</div>",
+        "html": "<div>old text</div>",
+    }
+    assert [expand for expand, _ in quote_html(html)] == [True, False]
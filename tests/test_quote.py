@@ -1,6 +1,8 @@
+import io
+
 import pytest
 
-from quotequail import quote
+from quotequail import quote, quote_file, quote_spans, quote_stream
 
 
 @pytest.mark.parametrize(
@@ -177,3 +179,146 @@ def test_limit():
         (True, "Lorem\nIpsum"),
         (False, "Dolor\nSit\nAmet"),
     ]
+
+
+def test_quote_spans():
+    text = (
+        "Hello world.\n\nOn Monday, John <john@example.com> wrote:\n\n> Hi\n"
+    )
+    assert quote_spans(text) == [(True, 0, 55), (False, 56, 62)]
+    assert quote_spans(text, quote_intro_line=True) == [
+        (True, 0, 13),
+        (False, 14, 62),
+    ]
+    for quote_intro_line in (False, True):
+        spans = quote_spans(text, quote_intro_line=quote_intro_line)
+        assert [(expand, text[start:end]) for expand, start, end in spans] == (
+            quote(text, quote_intro_line=quote_intro_line)
+        )
+
+    assert quote_spans("Hello") == [(True, 0, 5)]
+    assert quote_spans("Lorem\nIpsum\nDolor", limit=2) == [
+        (True, 0, 11),
+        (False, 12, 17),
+    ]
+
+
+def test_quote_without_limit():
+    text = "Hello\nOn Mon, Bob wrote:\n> x"
+    assert quote(text, limit=None) == [
+        (True, "Hello\nOn Mon, Bob wrote:"),
+        (False, "> x"),
+    ]
+    text = "\n".join(["Lorem"] * 2000)
+    assert quote(text, limit=None) == [(True, text)]
+    assert quote_spans(text, limit=None) == [(True, 0, len(text))]
+
+
+def test_quote_stream():
+    text = (
+        "Hello world.\n\nOn Monday, John <john@example.com> wrote:\n\n> Hi\n"
+    )
+    result = quote_stream(io.StringIO(text))
+    assert result.text == quote(text)[0][1]
+    assert result.quoted
+    assert result.offset == 56
+    assert "".join(result.rest) == text[56:] == quote(text)[1][1]
+
+    result = quote_stream(text.split("\n"), quote_intro_line=True)
+    assert result.text == "Hello world.\n"
+    assert list(result.rest) == [
+        "On Monday, John <john@example.com> wrote:",
+        "",
+        "> Hi",
+        "",
+    ]
+
+    result = quote_stream(["Hello", "world"])
+    assert result.text == "Hello\nworld"
+    assert not result.quoted
+    assert list(result.rest) == []
+
+
+def test_quote_stream_reads_lazily():
+    read = []
+
+    def lines():
+        for n in range(1000000):
+            read.append(n)
+            yield f"Line {n}\n"
+
+    result = quote_stream(lines(), limit=5)
+    assert result.text == "Line 0\nLine 1\nLine 2\nLine 3\nLine 4"
+    assert result.quoted
+    # One more line is read for patterns that wrap.
+    assert len(read) == 6
+    assert next(result.rest) == "Line 5\n"
+    assert next(result.rest) == "Line 6\n"
+    assert len(read) == 7
+
+
+def test_quote_bytes():
+    text = "Hallå\n\nOn Monday, Jöhn <j@example.com> wrote:\n\n> Quoted"
+    for charset in ("utf-8", "iso-8859-1", "utf-16"):
+        assert quote(text.encode(charset), charset=charset) == quote(text)
+    assert quote(text.encode()) == quote(text)
+    assert quote(b"Invalid \xff") == [(True, "Invalid \ufffd")]
+
+
+def test_quote_file(tmp_path):
+    path = tmp_path / "message.txt"
+    text = "Hallå\n\nOn Monday, Jöhn <j@example.com> wrote:\n\n> Quoted\n"
+    for charset in ("utf-8", "iso-8859-1"):
+        data = text.encode(charset)
+        path.write_bytes(data)
+        for quote_intro_line in (False, True):
+            spans = quote_file(
+                path, charset=charset, quote_intro_line=quote_intro_line
+            )
+            assert [
+                (expand, data[start:end].decode(charset))
+                for expand, start, end in spans
+            ] == quote(text, quote_intro_line=quote_intro_line)
+
+    path.write_bytes(b"Lorem\nIpsum\nDolor")
+    assert quote_file(path, limit=2) == [(True, 0, 11), (False, 12, 17)]
+
+    path.write_bytes(b"")
+    assert quote_file(path) == [(True, 0, 0)]
+
+    with pytest.raises(ValueError, match="unsupported charset"):
+        quote_file(path, charset="utf-16")
+
+
+def test_quote_parent():
+    parent = "Hi,\n\nAre we still on for Friday?\n\nJohn"
+    reply = (
+        "Yes!\n\n---------- Forwarded message ----------\nSee above.\n\n"
+        "On Monday, John <john@example.com> wrote:\n\n"
+        "> Hi,\n>\n> Are we still on for Friday?\n>\n> John\n"
+    )
+    # The quoted parent is found after the pattern-like line.
+    assert quote(reply, parent=parent) == [
+        (
+            True,
+            "Yes!\n\n---------- Forwarded message ----------\nSee above.\n\n"
+            "On Monday, John <john@example.com> wrote:",
+        ),
+        (False, "\n> Hi,\n>\n> Are we still on for Friday?\n>\n> John\n"),
+    ]
+    assert quote(reply, parent=parent, quote_intro_line=True)[1][1] == (
+        "On Monday, John <john@example.com> wrote:\n\n"
+        "> Hi,\n>\n> Are we still on for Friday?\n>\n> John\n"
+    )
+
+    # Quoting without a reply pattern is found as well.
+    reply = "Yes!\n\n> Hi,\n>\n> Are we still on for Friday?\n>\n> John"
+    assert quote(reply) == [(True, reply)]
+    assert quote(reply, parent=parent) == [
+        (True, "Yes!"),
+        (False, "\n> Hi,\n>\n> Are we still on for Friday?\n>\n> John"),
+    ]
+    assert quote(reply, parent=parent, limit=1) == quote(reply, limit=1)
+
+    # Without a match, the patterns are used.
+    assert quote(reply, parent="Something else") == [(True, reply)]
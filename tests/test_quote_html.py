@@ -1,6 +1,6 @@
 import pytest
 
-from quotequail import quote_html
+from quotequail import _html, quote_html
 
 
 @pytest.mark.parametrize(
@@ -237,6 +237,16 @@ def test_prefix_tag_2():
     ]
 
 
+def test_no_quote_unparsed():
+    # Markup that can't contain quoting isn't parsed and returned as is.
+    html = """<div>Hello<br>  world</div><p>Not closed"""
+    assert quote_html(html) == [(True, html)]
+    assert quote_html(html, limit=2) == [
+        (True, "<div>Hello<br>  world</div>"),
+        (False, "<p>Not closed</p>"),
+    ]
+
+
 def test_encoding():
     # We assume everything is UTF-8
     assert quote_html("""<?xml version="1.0" encoding="ISO-8859-1"?>
@@ -247,7 +257,7 @@ def test_encoding():
 <title></title>
 </head>
 <body>
-test ä
+test ä<blockquote>quoted ü</blockquote>
 </body>
 </html>""") == [
         (
@@ -258,8 +268,67 @@ test ä
 <title></title>
 </head>
 <body>
-test ä
+test ä<blockquote>quoted ü</blockquote>
 </body>
 </html>""",
         ),
     ]
+
+
+@pytest.mark.parametrize("parser", ["lxml", "html5lib"])
+@pytest.mark.parametrize(
+    "charset", ["utf-8", "windows-1252", "utf-16", "utf-32"]
+)
+def test_bytes(monkeypatch, parser, charset):
+    if parser == "html5lib":
+        pytest.importorskip("html5lib")
+
+    html = (
+        "<div>Hallå</div><div>On Monday, Jöhn &lt;j@example.com&gt; wrote:"
+        "</div><blockquote>Quoted</blockquote>"
+    )
+    # Full documents are recognized in any encoding.
+    document = f"<!DOCTYPE html><html><body>{html}</body></html>"
+    expected = quote_html(html, parser=parser)
+    expected_document = quote_html(document, parser=parser)
+    if parser == "lxml" and charset in ("utf-8", "windows-1252"):
+        # The bytes are parsed directly, without decoding and encoding them.
+        monkeypatch.setitem(_html.HTML_PARSERS, "lxml", None)
+    assert (
+        quote_html(html.encode(charset), parser=parser, charset=charset)
+        == expected
+    )
+    assert (
+        quote_html(document.encode(charset), parser=parser, charset=charset)
+        == expected_document
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 40, 16384])
+def test_incremental(monkeypatch, chunk_size):
+    monkeypatch.setattr(_html, "INITIAL_CHUNK_SIZE", chunk_size)
+    body = "".join(f"<p>Line {i}</p>" for i in range(50))
+    remainder = (
+        "<p>Line 50</p><div>On Mon, Someone wrote:</div>"
+        "<blockquote>Quoted</blockquote></body></html>"
+    )
+    html = "<!DOCTYPE html><html><body>" + body + "\n" + remainder
+
+    # The markup after the limit isn't parsed.
+    expanded, collapsed = quote_html(html, limit=5, incremental=True)
+    assert expanded == quote_html(html, limit=5)[0]
+    assert collapsed[0] is False
+    assert collapsed[1].startswith("<html><body><p>Line 5</p>")
+    assert collapsed[1].endswith("<p>Line 49</p>\n" + remainder)
+
+    # Without reaching the limit, the whole markup is parsed.
+    assert quote_html(html, incremental=True) == quote_html(html)
+
+
+def test_incremental_fragment():
+    # Only full documents are parsed incrementally.
+    html = "<p>A</p><p>B</p><p>C<p>D"
+    assert quote_html(html, limit=2, incremental=True) == [
+        (True, "<p>A</p><p>B</p>"),
+        (False, "<p>C</p><p>D</p>"),
+    ]
@@ -0,0 +1,130 @@
+import pytest
+
+from quotequail import QuoteScanner, quote_spans
+from quotequail._internal import find_unwrap_start
+from quotequail._patterns import (
+    MAX_WRAP_LINES,
+    MIN_HEADER_LINES,
+    MIN_QUOTED_LINES,
+)
+
+MESSAGES = [
+    "",
+    "Hello world.",
+    """Hello world.
+
+On 2012-10-16 at 17:02 , Someone <
+someone@example.com> wrote:
+
+> Some quoted text
+""",
+    """Hello
+
+Begin forwarded message:
+
+> From: "Some One" <some.one@example.com>
+> Date: 1. August 2011 23:28:15 GMT-07:00
+> To: "Other Person" <other@example.com>
+> Subject: AW: AW: Some subject
+>
+> Original text
+
+Text bottom
+""",
+    """Hello
+
+From: Someone <noreply@example.com>
+Subject: Weekend Spanish classes
+To: recipient@example.com
+
+Spanish Classes
+""",
+    "Hi\n\n> Quoted\n\n> text\n>\n> here",
+    "Hi\n> Quoted\nOnly two quoted lines\n> here",
+]
+
+
+def scan(text, chunk_size, **kwargs):
+    scanner = QuoteScanner(**kwargs)
+    for pos in range(0, len(text), chunk_size):
+        if scanner.feed(text[pos : pos + chunk_size]):
+            break
+    else:
+        scanner.close()
+    return scanner
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 10000])
+@pytest.mark.parametrize("quote_intro_line", [False, True])
+def test_quote_scanner(chunk_size, quote_intro_line):
+    for text in MESSAGES:
+        scanner = scan(text, chunk_size, quote_intro_line=quote_intro_line)
+        assert scanner.quote_done
+        assert scanner.unwrap_done
+
+        spans = quote_spans(text, quote_intro_line=quote_intro_line)
+        if len(spans) == 1:
+            assert scanner.quote_split is None
+        else:
+            split_n, offset = scanner.quote_split
+            assert offset == spans[1][1]
+            assert split_n == text[:offset].count("\n")
+
+        assert scanner.unwrap_start == find_unwrap_start(
+            text.split("\n"),
+            MAX_WRAP_LINES,
+            MIN_HEADER_LINES,
+            MIN_QUOTED_LINES,
+        )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 10000])
+def test_quote_scanner_end_of_text(chunk_size):
+    # The split is after the last line.
+    for text, limit, expected in [
+        ("Hi\nOn Monday, Bob <bob@example.com> wrote:", 1000, (1, 42)),
+        ("Hi\nOn Monday, Bob <bob@example.com> wrote:\n", 1000, (2, 43)),
+        ("\ntext\n", 3, (2, 6)),
+    ]:
+        scanner = scan(text, chunk_size, limit=limit)
+        assert scanner.quote_split == expected
+        assert quote_spans(text, limit=limit)[1][1] == expected[1]
+
+
+def test_quote_scanner_stops_early():
+    scanner = QuoteScanner()
+    # The pattern might still continue on the next line.
+    assert not scanner.feed("Hello world.\n\nOn Monday, John <\n")
+    assert not scanner.quote_done
+    assert not scanner.unwrap_done
+    assert scanner.feed("john@example.com> wrote:\n")
+    assert scanner.quote_split == (4, 57)
+    assert scanner.unwrap_start == (2, 3, "reply")
+    # Once done, further text is ignored.
+    assert scanner.feed("> Quoted text")
+
+
+def test_quote_scanner_limit():
+    scanner = QuoteScanner(limit=3)
+    assert not scanner.feed("A\nB\nC\n")
+    # A pattern on the third line might continue on the fourth one.
+    assert not scanner.quote_done
+    assert not scanner.feed("D\n")
+    assert scanner.quote_done
+    assert scanner.quote_split == (3, 6)
+    assert not scanner.unwrap_done
+    scanner.close()
+    assert scanner.unwrap_start is None
+
+
+def test_quote_scanner_buffer():
+    scanner = QuoteScanner(limit=None)
+    for n in range(1000):
+        assert not scanner.feed(f"Line {n}\n")
+        assert len(scanner._lines) <= 2 * MAX_WRAP_LINES
+    scanner.close()
+    assert scanner.quote_split is None
+    assert scanner.unwrap_start is None
+
+    with pytest.raises(ValueError, match="after close"):
+        scanner.feed("More")
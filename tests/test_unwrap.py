@@ -1,6 +1,13 @@
 import pytest
 
-from quotequail import unwrap
+from quotequail import (
+    UnwrapResult,
+    unwrap,
+    unwrap_file,
+    unwrap_lazy,
+    unwrap_spans,
+    unwrap_thread,
+)
 
 
 @pytest.mark.parametrize(
@@ -425,3 +432,191 @@ Learn Spanish
 )
 def test_unwrap(text, expected):
     assert unwrap(text) == expected
+
+
+def test_unwrap_spans():
+    text = """Hello
+
+Begin forwarded message:
+
+> From: "Some One" <some.one@example.com>
+> Subject: Hi
+>
+>  Original text
+>
+
+Text bottom
+"""
+    result = unwrap_spans(text)
+    assert result == {
+        "type": "forward",
+        "text_top": (0, 5),
+        "text": (91, 107),
+        "text_bottom": (111, 122),
+        "unindent": True,
+        "from": '"Some One" <some.one@example.com>',
+        "subject": "Hi",
+    }
+    assert text[0:5] == "Hello"
+    assert text[91:107] == ">  Original text"
+    assert text[111:122] == "Text bottom"
+
+    text = """Hi
+
+---------- Forwarded message ----------
+From: a@b.c
+Subject: Hey
+
+Body
+"""
+    result = unwrap_spans(text)
+    assert result == {
+        "type": "forward",
+        "text_top": (0, 2),
+        "text": (70, 74),
+        "from": "a@b.c",
+        "subject": "Hey",
+    }
+    assert text[70:74] == "Body"
+
+    assert unwrap_spans("Hello") is None
+
+
+def test_unwrap_lazy():
+    text = """Hello
+
+Begin forwarded message:
+
+> From: "Some One" <some.one@example.com>
+> Subject: Hi
+>
+> Original text
+
+Text bottom
+"""
+    result = unwrap_lazy(text)
+    assert isinstance(result, UnwrapResult)
+    assert result.type == "forward"
+    assert result.headers == {
+        "from": '"Some One" <some.one@example.com>',
+        "subject": "Hi",
+    }
+    assert not hasattr(result, "__dict__")
+    assert result.to_dict() == unwrap(text)
+    assert result.text == "Original text"
+    assert result.text_top == "Hello"
+    assert result.text_bottom == "Text bottom"
+
+    result = unwrap_lazy("Hi\n\n> Quoted\n> text\n> here")
+    assert result.type == "quote"
+    assert result.headers == {}
+    assert result.text_bottom is None
+    assert result.to_dict() == {
+        "type": "quote",
+        "text": "Quoted\ntext\nhere",
+        "text_top": "Hi",
+    }
+
+    assert unwrap_lazy("Hello") is None
+
+
+def test_unwrap_bytes():
+    text = "Hallå\n\nOn Monday, Jöhn <j@example.com> wrote:\n\n> Quoted"
+    assert unwrap(text.encode("utf-16"), charset="utf-16") == unwrap(text)
+    assert unwrap(text.encode()) == unwrap(text)
+
+
+def test_unwrap_file(tmp_path):
+    path = tmp_path / "message.txt"
+    path.write_text(
+        "Grüße\n\nBegin forwarded message:\n\n"
+        "> From: Jöhn <j@example.com>\n> Subject: Hi\n>\n>  Original text\n",
+        encoding="utf-8",
+    )
+    result = unwrap_file(path)
+    assert result == {
+        "type": "forward",
+        "text_top": (0, 7),
+        "text": (81, 97),
+        "unindent": True,
+        "from": "Jöhn <j@example.com>",
+        "subject": "Hi",
+    }
+    data = path.read_bytes()
+    assert data[0:7].decode() == "Grüße"
+    assert data[81:97] == b">  Original text"
+
+    path.write_bytes(b"Hello")
+    assert unwrap_file(path) is None
+
+
+def test_unwrap_parent():
+    parent = "Hi,\n\nAre we still on for Friday?\n\nJohn"
+    reply = (
+        "Yes!\n\n---------- Forwarded message ----------\nSee above.\n\n"
+        "On Monday, John <john@example.com> wrote:\n\n"
+        "> Hi,\n>\n> Are we still on for Friday?\n>\n> John\n"
+    )
+    assert unwrap(reply)["type"] == "forward"
+    assert unwrap(reply, parent=parent) == {
+        "type": "reply",
+        "date": "Monday",
+        "from": "John <john@example.com>",
+        "text_top": (
+            "Yes!\n\n---------- Forwarded message ----------\nSee above."
+        ),
+        "text": "Hi,\n\nAre we still on for Friday?\n\nJohn",
+    }
+
+    reply = "Yes!\n\n> Hi,\n>\n> Are we still on for Friday?\n>\n> John"
+    assert unwrap(reply, parent=parent) == unwrap(reply)
+    assert unwrap_spans(reply, parent=parent) == unwrap_spans(reply)
+    assert unwrap("Yes!", parent=parent) is None
+
+
+def test_unwrap_thread():
+    text = (
+        "Thanks!\n\n"
+        "On Tuesday, Jane <jane@example.com> wrote:\n\n"
+        "> See below.\n>\n"
+        "> ---------- Forwarded message ----------\n"
+        "> From: John <john@example.com>\n"
+        "> Subject: Friday\n>\n"
+        "> On Monday, Bob <bob@example.com> wrote:\n>\n"
+        "> > Are we still on for Friday?\n\n"
+        "Cheers"
+    )
+    assert unwrap_thread(text) == [
+        {
+            "type": "reply",
+            "date": "Tuesday",
+            "from": "Jane <jane@example.com>",
+            "text_top": "Thanks!",
+            "text_bottom": "Cheers",
+        },
+        {
+            "type": "forward",
+            "from": "John <john@example.com>",
+            "subject": "Friday",
+            "text_top": "See below.",
+        },
+        {
+            "type": "reply",
+            "date": "Monday",
+            "from": "Bob <bob@example.com>",
+            "text": "Are we still on for Friday?",
+        },
+    ]
+
+    # Each level is what unwrap() returns for the text of the previous one.
+    levels = []
+    result = unwrap(text)
+    while result:
+        levels.append(result)
+        result = unwrap(result["text"])
+    assert [{**level, "text": None} for level in levels] == [
+        {**level, "text": None} for level in unwrap_thread(text)
+    ]
+
+    assert unwrap_thread(text.encode()) == unwrap_thread(text)
+    assert unwrap_thread("Hello") == []
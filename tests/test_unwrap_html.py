@@ -1,6 +1,6 @@
 import pytest
 
-from quotequail import quote_html, unwrap_html
+from quotequail import quote_html, unwrap_html, unwrap_thread_html
 
 
 @pytest.mark.parametrize(
@@ -252,6 +252,22 @@ def test_quote_html_yahoo_reply_with_unescaped_address(read_file):
     ]
 
 
+@pytest.mark.parametrize(
+    "html",
+    [
+        "<style><!-- p {} --></style><p>a</p><p>b</p><p>c</p>",
+        "outlook_forward_unwrapped.html",
+    ],
+)
+def test_quote_html_limit_with_style(read_file, html):
+    # The text of a <style> element is a line, so the limit is reached.
+    if html.endswith(".html"):
+        html = read_file(html)
+    result = quote_html(html, limit=4)
+    assert [expand for expand, _ in result] == [True, False]
+    assert "<style>" in result[0][1]
+
+
 def test_mailru_forward(read_file):
     data = read_file("mailru_forward.html")
     result = unwrap_html(data)
@@ -263,3 +279,97 @@ def test_mailru_forward(read_file):
     assert "html_top" not in result
     assert result["html"] == read_file("mailru_forward_unwrapped.html")
     assert "html_bottom" not in result
+
+
+def test_mailru_forward_bytes(read_file):
+    data = read_file("mailru_forward.html")
+    assert unwrap_html(data.encode("koi8-r"), charset="koi8-r") == (
+        unwrap_html(data)
+    )
+    document = f"<html><body>{data}</body></html>"
+    for charset in ("utf-16", "utf-32"):
+        assert unwrap_html(document.encode(charset), charset=charset) == (
+            unwrap_html(document)
+        )
+    # Unknown charsets fall back to UTF-8.
+    assert unwrap_html(data.encode(), charset="unknown") == unwrap_html(data)
+
+
+def test_unwrap_thread_html():
+    html = (
+        "<p>Thanks!</p>"
+        "<div>On Tuesday, Jane &lt;jane@example.com&gt; wrote:</div>"
+        "<blockquote><p>See below.</p>"
+        "<p>---------- Forwarded message ----------<br>"
+        "From: John &lt;john@example.com&gt;<br>Subject: Friday</p>"
+        "<div>On Monday, Bob &lt;bob@example.com&gt; wrote:</div>"
+        "<blockquote>Are we still on for Friday?</blockquote></blockquote>"
+    )
+    assert unwrap_thread_html(html) == [
+        {
+            "type": "reply",
+            "date": "Tuesday",
+            "from": "Jane <jane@example.com>",
+            "html_top": "<p>Thanks!</p>",
+        },
+        {
+            "type": "forward",
+            "from": "John <john@example.com>",
+            "subject": "Friday",
+            "html_top": "<div><p>See below.</p></div>",
+        },
+        {
+            "type": "reply",
+            "date": "Monday",
+            "from": "Bob <bob@example.com>",
+            "html": "<div><div>Are we still on for Friday?</div></div>",
+        },
+    ]
+    assert unwrap_thread_html(html, parser="html5lib") == (
+        unwrap_thread_html(html)
+    )
+    assert unwrap_thread_html("<p>html text</p>") == []
+
+
+def test_unwrap_thread_html_empty_quote():
+    # The levels are found in the lines of the parsed tree, where the inner
+    # blockquote is a quote level of its own, while the HTML unwrap_html()
+    # renders for the outer level has no text left to unwrap.
+    html = (
+        "<p>Hi there</p>"
+        "<blockquote><blockquote><br></blockquote><br><br></blockquote>"
+    )
+    assert unwrap_html(html) == {
+        "type": "quote",
+        "html_top": "<p>Hi there</p>",
+        "html": "<div><blockquote></blockquote></div>",
+    }
+    assert unwrap_html("<div><blockquote></blockquote></div>") is None
+    assert unwrap_thread_html(html) == [
+        {"type": "quote", "html_top": "<p>Hi there</p>"},
+        {"type": "quote"},
+    ]
+
+
+@pytest.mark.parametrize(
+    "filename",
+    [
+        "apple_reply.html",
+        "gmail_forward.html",
+        "mailru_forward.html",
+        "outlook_forward.html",
+        "thunderbird_forward.html",
+    ],
+)
+def test_unwrap_thread_html_files(read_file, filename):
+    # Each level is what unwrap_html() returns for the HTML of the previous
+    # one.
+    html = read_file(filename)
+    levels = []
+    result = unwrap_html(html)
+    while result:
+        levels.append(result)
+        result = unwrap_html(result["html"])
+    for level in levels[:-1]:
+        del level["html"]
+    assert unwrap_thread_html(html) == levels